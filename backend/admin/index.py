@@ -1,38 +1,541 @@
 import json
-import os
-import psycopg2
+import base64
 import csv
+import gzip
 import io
-from typing import Dict, Any
+import zipfile
+from datetime import date
+from typing import Dict, Any, BinaryIO, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+import psycopg2
+
+import db
+import pricing
+from response import (
+    http_handler, json_response, error_response, body_response, binary_response, options_response,
+    parse_limit, parse_int_param, encode_cursor, decode_cursor, cursor_datetime
+)
+
+REBUILD_ANALYTICS_SQL = """
+    INSERT INTO analytics_daily (date, total_orders, total_revenue, new_customers, avg_order_value)
+    SELECT d.date,
+           COALESCE(o.total_orders, 0),
+           COALESCE(o.total_revenue, 0),
+           COALESCE(u.new_customers, 0),
+           COALESCE(o.total_revenue / NULLIF(o.total_orders, 0), 0)
+    FROM (
+        SELECT DATE(created_at) AS date FROM orders WHERE created_at >= %(since)s
+        UNION
+        SELECT DATE(created_at) FROM users WHERE role = 'customer' AND created_at >= %(since)s
+    ) d
+    LEFT JOIN (
+        SELECT DATE(created_at) AS date, COUNT(*) AS total_orders, SUM(total_amount) AS total_revenue
+        FROM orders WHERE created_at >= %(since)s
+        GROUP BY DATE(created_at)
+    ) o ON o.date = d.date
+    LEFT JOIN (
+        SELECT DATE(created_at) AS date, COUNT(*) AS new_customers
+        FROM users WHERE role = 'customer' AND created_at >= %(since)s
+        GROUP BY DATE(created_at)
+    ) u ON u.date = d.date
+"""
+
+STATS_WINDOWS = (7, 30, 365)
+
+CUSTOMER_STATS_BATCH_SIZE = 500
+
+REBUILD_CUSTOMER_STATS_SQL = """
+    UPDATE customers c SET
+        total_orders = s.total_orders,
+        total_spent = s.total_spent,
+        last_order_date = s.last_order_date,
+        updated_at = CURRENT_TIMESTAMP
+    FROM customers k
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*)::INTEGER AS total_orders,
+               COALESCE(SUM(o.total_amount), 0)::INTEGER AS total_spent,
+               MAX(o.created_at) AS last_order_date
+        FROM orders o
+        WHERE o.user_id = k.user_id AND o.status IS DISTINCT FROM 'cancelled'
+    ) s
+    WHERE k.id = c.id AND c.id = ANY(%s)
+      AND (c.total_orders, c.total_spent, c.last_order_date)
+          IS DISTINCT FROM (s.total_orders, s.total_spent, s.last_order_date)
+"""
+
+CUSTOMER_SORTS = {
+    'total_spent': "COALESCE(c.total_spent, 0)",
+    'total_orders': "COALESCE(c.total_orders, 0)",
+    'last_order_date': "COALESCE(c.last_order_date, '-infinity'::TIMESTAMP)",
+    'created_at': "COALESCE(c.created_at, '-infinity'::TIMESTAMP)"
+}
+CUSTOMER_DATE_SORTS = ('last_order_date', 'created_at')
+CUSTOMER_LIST_PARAMS = ('q', 'status', 'last_order_from', 'last_order_to', 'sort', 'order', 'limit', 'cursor')
+CUSTOMERS_DEFAULT_LIMIT = 50
+CUSTOMERS_MAX_LIMIT = 200
+CUSTOMERS_LEGACY_LIMIT = 100
+
+CATEGORY_NAMES = {
+    'peonies': 'Пионы', 'clematis': 'Клематисы',
+    'shrubs': 'Кустарники', 'seeds': 'Семена',
+    'fertilizers': 'Удобрения', 'other': 'Другое'
+}
+CATEGORY_CODES = {name: code for code, name in CATEGORY_NAMES.items()}
+EXPORT_HEADER = ['Название', 'Категория', 'Цена (₽)', 'Наличие', 'Описание']
+EXPORT_CHUNK_SIZE = 2000
+IMPORT_FIELDS = ['name', 'category', 'price', 'stock', 'description']
+IMPORT_MAX_ROWS = 20000
+
+IMPORT_VALIDATE_SQL = """
+    UPDATE product_import SET error = COALESCE(error, CASE
+        WHEN name IS NULL THEN 'name is required'
+        WHEN length(name) > 255 THEN 'name is longer than 255 characters'
+        WHEN category IS NULL OR NOT category = ANY(%(categories)s) THEN 'unknown category'
+        WHEN price IS NULL OR price !~ '^[0-9]{1,9}$' THEN 'price must be a non-negative integer'
+        WHEN stock !~ '^[0-9]{1,9}$' THEN 'stock must be a non-negative integer'
+    END)
+"""
+
+IMPORT_DUPLICATES_SQL = """
+    UPDATE product_import s SET error = 'duplicate of line ' || d.first_line
+    FROM (
+        SELECT line, MIN(line) OVER (PARTITION BY category, name) AS first_line
+        FROM product_import
+        WHERE error IS NULL
+    ) d
+    WHERE d.line = s.line AND d.first_line <> s.line
+"""
+
+IMPORT_UPDATE_SQL = """
+    UPDATE products p
+    SET price = s.price::INTEGER,
+        stock = COALESCE(s.stock::INTEGER, p.stock),
+        description = COALESCE(s.description, p.description),
+        updated_at = clock_timestamp()
+    FROM product_import s
+    WHERE s.error IS NULL AND p.category = s.category AND p.name = s.name
+      AND (p.price, p.stock, p.description) IS DISTINCT FROM
+          (s.price::INTEGER, COALESCE(s.stock::INTEGER, p.stock), COALESCE(s.description, p.description))
+    RETURNING p.id
+"""
+
+IMPORT_INSERT_SQL = """
+    INSERT INTO products (name, category, price, stock, description, image_url)
+    SELECT s.name, s.category, s.price::INTEGER, COALESCE(s.stock::INTEGER, 0), s.description, '/placeholder.svg'
+    FROM product_import s
+    WHERE s.error IS NULL
+      AND NOT EXISTS (SELECT 1 FROM products p WHERE p.category = s.category AND p.name = s.name)
+    ORDER BY s.line
+    RETURNING id
+"""
+
+XLSX_STATIC_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Прайс-лист" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    )
+}
+
+def iter_export_rows(conn, categories: List[str]) -> Iterator[List[Any]]:
+    """Читает товары серверным курсором порциями по EXPORT_CHUNK_SIZE строк."""
+    cur = conn.cursor(name='pricelist_export')
+    cur.itersize = EXPORT_CHUNK_SIZE
+    try:
+        if categories:
+            cur.execute("""
+                SELECT name, category, price, stock, description
+                FROM products
+                WHERE category = ANY(%s)
+                ORDER BY category, name
+            """, (categories,))
+        else:
+            cur.execute("""
+                SELECT name, category, price, stock, description
+                FROM products
+                ORDER BY category, name
+            """)
+        for row in cur:
+            yield [row[0], CATEGORY_NAMES.get(row[1], row[1]), row[2], row[3], row[4] or '']
+    finally:
+        cur.close()
+
+def write_csv(rows: Iterator[List[Any]], stream: BinaryIO) -> None:
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_HEADER)
+    for row in rows:
+        writer.writerow(row)
+    text.detach()
+
+def xlsx_row(index: int, values: List[Any]) -> str:
+    cells = []
+    for col, value in enumerate(values):
+        ref = 'ABCDE'[col] + str(index)
+        if isinstance(value, int):
+            cells.append('<c r="%s"><v>%d</v></c>' % (ref, value))
+        else:
+            text = '' if value is None else str(value)
+            cells.append('<c r="%s" t="inlineStr"><is><t>%s</t></is></c>' % (ref, escape(text)))
+    return '<row r="%d">%s</row>' % (index, ''.join(cells))
+
+def write_xlsx(rows: Iterator[List[Any]], stream: BinaryIO) -> None:
+    """Минимальная книга XLSX из одного листа; строки пишутся в архив по мере чтения."""
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_STATIC_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(xlsx_row(1, EXPORT_HEADER).encode('utf-8'))
+            for index, row in enumerate(rows, start=2):
+                sheet.write(xlsx_row(index, row).encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+
+def read_body_bytes(event: Dict[str, Any]) -> bytes:
+    """Тело запроса как байты: base64 раскодируется, gzip распаковывается."""
+    body = event.get('body') or ''
+    raw = base64.b64decode(body) if event.get('isBase64Encoded') else body.encode('utf-8')
+    if raw[:2] == b'\x1f\x8b':
+        raw = gzip.decompress(raw)
+    return raw
+
+def parse_import_csv(raw: bytes) -> Iterator[Tuple[int, List[Any]]]:
+    """Строки CSV в формате экспорта (тот же заголовок) с номерами строк файла."""
+    reader = csv.reader(io.StringIO(raw.decode('utf-8-sig'), newline=''))
+    header = next(reader, None)
+    if header is None or [h.strip() for h in header] != EXPORT_HEADER:
+        raise ValueError('CSV header must be: ' + ','.join(EXPORT_HEADER))
+    for values in reader:
+        if not any(v.strip() for v in values):
+            continue
+        yield reader.line_num, values
+
+def parse_import_json(raw: bytes) -> Iterator[Tuple[int, List[Any]]]:
+    """Объекты {"products": [{name, category, price, stock, description}]}; номер строки - позиция в списке."""
+    data = json.loads(raw.decode('utf-8'))
+    products = data.get('products') if isinstance(data, dict) else None
+    if not isinstance(products, list):
+        raise ValueError('products must be a list')
+    for index, item in enumerate(products, start=1):
+        if not isinstance(item, dict):
+            yield index, []
+            continue
+        yield index, [item.get(field) for field in IMPORT_FIELDS]
+
+def write_import_csv(rows: Iterator[Tuple[int, List[Any]]], stream: BinaryIO) -> int:
+    """
+    Пишет строки для COPY в product_import. Названия категорий из экспорта переводятся в коды,
+    пустые значения становятся NULL; строки с неверным числом колонок сразу получают ошибку.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(text)
+    count = 0
+    for line, values in rows:
+        count += 1
+        if count > IMPORT_MAX_ROWS:
+            raise OverflowError('At most %d rows per import' % IMPORT_MAX_ROWS)
+        error = None if len(values) == len(IMPORT_FIELDS) else 'expected %d columns' % len(IMPORT_FIELDS)
+        values = (list(values) + [None] * len(IMPORT_FIELDS))[:len(IMPORT_FIELDS)]
+        cells = ['' if v is None else str(v).strip() for v in values]
+        cells[1] = CATEGORY_CODES.get(cells[1], cells[1])
+        writer.writerow([line] + cells + [error or ''])
+    text.detach()
+    return count
+
+def import_products(cur, rows: Iterator[Tuple[int, List[Any]]]) -> Dict[str, Any]:
+    """
+    Загружает строки COPY во временную таблицу, проверяет их одним UPDATE и переносит в products:
+    товар с тем же названием и категорией обновляется, новый - добавляется. Строки с ошибками
+    пропускаются и возвращаются списком, product_ids - изменённые и добавленные товары.
+    Коммит/откат - на стороне вызывающего.
+    """
+    staging = io.BytesIO()
+    total = write_import_csv(rows, staging)
+    staging.seek(0)
+
+    cur.execute("""
+        CREATE TEMP TABLE product_import (
+            line INTEGER, name TEXT, category TEXT, price TEXT, stock TEXT, description TEXT, error TEXT
+        ) ON COMMIT DROP
+    """)
+    cur.copy_expert(
+        "COPY product_import (line, name, category, price, stock, description, error) FROM STDIN WITH (FORMAT csv)",
+        staging
+    )
+    cur.execute(IMPORT_VALIDATE_SQL, {'categories': list(CATEGORY_NAMES)})
+    cur.execute(IMPORT_DUPLICATES_SQL)
+    cur.execute(IMPORT_UPDATE_SQL)
+    updated_ids = [row[0] for row in cur.fetchall()]
+    cur.execute(IMPORT_INSERT_SQL)
+    inserted_ids = [row[0] for row in cur.fetchall()]
+    cur.execute("SELECT line, error FROM product_import WHERE error IS NOT NULL ORDER BY line")
+    errors = [{'line': line, 'error': error} for line, error in cur.fetchall()]
+
+    return {
+        'rows': total,
+        'inserted': len(inserted_ids),
+        'updated': len(updated_ids),
+        'unchanged': total - len(errors) - len(inserted_ids) - len(updated_ids),
+        'errors': errors,
+        'product_ids': updated_ids + inserted_ids
+    }
+
+def parse_price_list(body_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Проверяет поля прайс-листа; items - [{product_id, custom_price}], без ключа позиции не меняются."""
+    if not (body_data.get('name') or '').strip():
+        raise ValueError('name is required')
+    discount = body_data.get('discount_percent') or 0
+    if not isinstance(discount, int) or isinstance(discount, bool) or not 0 <= discount <= 100:
+        raise ValueError('discount_percent must be an integer from 0 to 100')
+    for key in ('valid_from', 'valid_to'):
+        if body_data.get(key):
+            date.fromisoformat(body_data[key])
+    
+    items = body_data.get('items')
+    if items is not None:
+        if not isinstance(items, list):
+            raise ValueError('items must be a list')
+        for item in items:
+            price = item.get('custom_price') if isinstance(item, dict) else None
+            product_id = item.get('product_id') if isinstance(item, dict) else None
+            if (not isinstance(price, int) or isinstance(price, bool) or price < 0
+                    or not isinstance(product_id, int) or isinstance(product_id, bool)):
+                raise ValueError('Each item needs integer product_id and non-negative custom_price')
+    
+    return {
+        'name': body_data['name'].strip(), 'description': body_data.get('description'),
+        'discount_percent': discount, 'valid_from': body_data.get('valid_from') or None,
+        'valid_to': body_data.get('valid_to') or None, 'is_active': bool(body_data.get('is_active', True)),
+        'items': items
+    }
+
+def save_price_list_items(cur, price_list_id: int, items: List[Dict[str, Any]]) -> None:
+    cur.execute("DELETE FROM price_list_items WHERE price_list_id = %s", (price_list_id,))
+    cur.execute("""
+        INSERT INTO price_list_items (price_list_id, product_id, custom_price)
+        SELECT %s, product_id, custom_price
+        FROM jsonb_to_recordset(%s::jsonb) AS x(product_id INTEGER, custom_price INTEGER)
+    """, (price_list_id, json.dumps(items)))
+
+def missing_products(cur, product_ids: List[int]) -> List[int]:
+    """id из списка, которых нет в products."""
+    cur.execute("""
+        SELECT x FROM unnest(%s::INTEGER[]) AS x
+        WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.id = x)
+        ORDER BY x
+    """, (product_ids,))
+    return [row[0] for row in cur.fetchall()]
+
+def price_list_customers(cur, price_list_id: int) -> List[int]:
+    cur.execute("SELECT id FROM customers WHERE price_list_id = %s", (price_list_id,))
+    return [row[0] for row in cur.fetchall()]
+
+def cursor_number(value: Any) -> Any:
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        raise TypeError('Cursor value must be a number')
+    return value
+
+def decode_customer_cursor(cursor: str, sort: str) -> Tuple[Any, int]:
+    """Курсор списка клиентов: (sort, значение ключа сортировки, id); годится только для той же сортировки."""
+    cast_value = cursor_datetime if sort in CUSTOMER_DATE_SORTS else cursor_number
+    cursor_sort, value, customer_id = decode_cursor(cursor, str, cast_value, int)
+    if cursor_sort != sort:
+        raise ValueError('Invalid cursor')
+    return value, customer_id
+
+def like_pattern(text: str) -> str:
+    return '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def list_customers(cur, params: Dict[str, Any], limit: int) -> Dict[str, Any]:
+    """
+    Список клиентов CRM с поиском по email/имени/телефону/компании, фильтрами status и
+    last_order_from/to и постраничной выдачей по ключу (sort, id). Поиск - c.id IN (UNION):
+    ветка по customers и ветка по users, каждая со своими триграммными индексами.
+    """
+    sort = params.get('sort') or 'total_spent'
+    if sort not in CUSTOMER_SORTS:
+        raise ValueError('sort must be one of ' + ', '.join(CUSTOMER_SORTS))
+    descending = (params.get('order') or 'desc') != 'asc'
+    sort_sql = CUSTOMER_SORTS[sort]
+    
+    conditions = []
+    args: Dict[str, Any] = {'limit': limit + 1}
+    query = (params.get('q') or '').strip()
+    if query:
+        args['pattern'] = like_pattern(query)
+        user_matches = ["u2.email ILIKE %(pattern)s", "u2.full_name ILIKE %(pattern)s"]
+        digits = ''.join(ch for ch in query if ch.isdigit())
+        if len(digits) >= 3:
+            args['phone_pattern'] = '%' + digits + '%'
+            user_matches.append("regexp_replace(u2.phone, '\\D', '', 'g') LIKE %(phone_pattern)s")
+        conditions.append(
+            "c.id IN (SELECT c1.id FROM customers c1 WHERE c1.company_name ILIKE %(pattern)s "
+            "UNION SELECT c2.id FROM customers c2 JOIN users u2 ON u2.id = c2.user_id "
+            "WHERE " + " OR ".join(user_matches) + ")"
+        )
+    if params.get('status'):
+        conditions.append("c.status = %(status)s")
+        args['status'] = params['status']
+    for key, condition in (('last_order_from', "c.last_order_date >= %(last_order_from)s"),
+                           ('last_order_to', "c.last_order_date < %(last_order_to)s::DATE + 1")):
+        if params.get(key):
+            try:
+                args[key] = date.fromisoformat(params[key])
+            except (ValueError, TypeError):
+                raise ValueError('Invalid ' + key)
+            conditions.append(condition)
+    if params.get('cursor'):
+        args['cursor_value'], args['cursor_id'] = decode_customer_cursor(params['cursor'], sort)
+        conditions.append("(%s, c.id) %s (%%(cursor_value)s, %%(cursor_id)s)" % (sort_sql, '<' if descending else '>'))
+    
+    direction = 'DESC' if descending else 'ASC'
+    sql = (
+        "SELECT c.id, u.email, u.full_name, u.phone, c.company_name, c.total_orders, c.total_spent, "
+        "c.status, c.last_order_date, c.created_at, " + sort_sql + " "
+        "FROM customers c JOIN users u ON c.user_id = u.id"
+    )
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY %s %s, c.id %s LIMIT %%(limit)s" % (sort_sql, direction, direction)
+    
+    cur.execute(sql, args)
+    rows = cur.fetchall()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort, rows[-1][10], rows[-1][0])
+    
+    items = [
+        {
+            'id': row[0], 'email': row[1], 'full_name': row[2], 'phone': row[3], 'company_name': row[4],
+            'total_orders': row[5], 'total_spent': row[6], 'status': row[7],
+            'last_order_date': row[8].isoformat() if row[8] else None,
+            'created_at': row[9].isoformat() if row[9] else None
+        }
+        for row in rows
+    ]
+    return {'items': items, 'next_cursor': next_cursor}
+
+def rebuild_customer_stats(conn, cur, batch_size: int, max_batches: int, after_id: int = 0) -> Dict[str, Any]:
+    """
+    Пересчитывает total_orders, total_spent и last_order_date клиентов из orders порциями
+    по batch_size в порядке id, фиксируя каждую порцию отдельно. Строки порции сначала
+    блокируются, и только потом читаются заказы: заказ, оформленный параллельно, либо уже
+    виден пересчёту, либо ждёт блокировку и добавляет себя к пересчитанному значению.
+    """
+    processed = 0
+    changed = 0
+    last_id = after_id
+    for _ in range(max_batches):
+        cur.execute(
+            "SELECT id FROM customers WHERE id > %s ORDER BY id LIMIT %s FOR UPDATE",
+            (last_id, batch_size)
+        )
+        ids = [row[0] for row in cur.fetchall()]
+        if not ids:
+            conn.commit()
+            return {'processed': processed, 'changed': changed, 'last_id': None}
+        cur.execute(REBUILD_CUSTOMER_STATS_SQL, (ids,))
+        changed += cur.rowcount
+        conn.commit()
+        processed += len(ids)
+        last_id = ids[-1]
+    return {'processed': processed, 'changed': changed, 'last_id': last_id}
 
+def rebuild_product_stats(cur) -> int:
+    """Пересчитывает product_sales_summary и product_sales_daily по всей истории заказов."""
+    cur.execute("DELETE FROM product_sales_daily")
+    cur.execute("DELETE FROM product_sales_summary")
+    cur.execute("""
+        INSERT INTO product_sales_summary (product_id, times_ordered, total_quantity, total_revenue, last_sold_at)
+        SELECT oi.product_id, COUNT(*), SUM(oi.quantity), SUM(oi.quantity * oi.price), MAX(o.created_at)
+        FROM order_items oi
+        JOIN orders o ON o.id = oi.order_id
+        WHERE oi.product_id IS NOT NULL
+        GROUP BY oi.product_id
+    """)
+    products = cur.rowcount
+    cur.execute("""
+        INSERT INTO product_sales_daily (product_id, date, times_ordered, quantity, revenue)
+        SELECT oi.product_id, DATE(o.created_at), COUNT(*), SUM(oi.quantity), SUM(oi.quantity * oi.price)
+        FROM order_items oi
+        JOIN orders o ON o.id = oi.order_id
+        WHERE oi.product_id IS NOT NULL
+        GROUP BY oi.product_id, DATE(o.created_at)
+    """)
+    return products
+
+def rebuild_analytics(cur, days: Optional[int] = None) -> int:
+    """Пересчитывает analytics_daily из orders и users: за последние days дней или целиком."""
+    since = date.min
+    if days:
+        cur.execute("SELECT CURRENT_DATE - %s", (days,))
+        since = cur.fetchone()[0]
+    cur.execute("DELETE FROM analytics_daily WHERE date >= %s", (since,))
+    cur.execute(REBUILD_ANALYTICS_SQL, {'since': since})
+    return cur.rowcount
+
+@http_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Универсальный API для админ-панели
-    GET /dashboard - статистика дашборда
-    GET /customers - список клиентов CRM
+    GET /dashboard - статистика дашборда (из сводки analytics_daily)
+    GET /customers - список клиентов CRM (первые 100 по сумме покупок)
+    GET /customers?q=&status=&last_order_from=&last_order_to=&sort=total_spent|total_orders|last_order_date|created_at&order=desc|asc&limit=&cursor=
+        - поиск и постраничный список {items, next_cursor}
     GET /customers?id=1 - детали клиента
-    PUT /customers?id=1 - обновить клиента
+    PUT /customers?id=1 - обновить клиента; price_list_id меняется, только если ключ передан
+    GET /price_lists - прайс-листы, GET /price_lists?id=1 - с позициями
+    POST /price_lists, PUT /price_lists?id=1 - создать/изменить прайс-лист {name, discount_percent, valid_from, valid_to, is_active, items}
     GET /sales?days=30 - статистика продаж
-    GET /products/stats - популярные товары
-    GET /export?format=csv - экспорт прайс-листа
+    POST /analytics/rebuild?days=30 - пересчитать дневную сводку (без days - всю историю)
+    GET /products/stats?days=30 - популярные товары (days: 7, 30, 365 или вся история)
+    POST /products/stats/rebuild - пересчитать сводку продаж по товарам
+    POST /customers/rebuild?batch_size=500&max_batches=100&after_id=0 - пересчитать счётчики заказов клиентов
+        (ответ last_id - продолжить с after_id=last_id, null - пересчитаны все)
+    GET /export?format=csv|xlsx&compress=gzip&category=peonies,clematis - экспорт прайс-листа
+    POST /import?format=csv|json&dry_run=1 - загрузка прайс-листа (CSV как в экспорте, можно gzip)
     """
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return options_response('GET, POST, PUT, OPTIONS', 'Content-Type, X-Auth-Token')
     
-    dsn = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(dsn)
+    conn = db.acquire()
     cur = conn.cursor()
     
     try:
@@ -42,47 +545,25 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if path == 'dashboard':
             cur.execute("""
                 SELECT 
-                    COUNT(*) as total_orders,
-                    COALESCE(SUM(total_amount), 0) as total_revenue,
-                    COALESCE(AVG(total_amount), 0) as avg_order_value
-                FROM orders
-            """)
-            orders_stats = cur.fetchone()
-            
-            cur.execute("SELECT COUNT(*) FROM products")
-            total_products = cur.fetchone()[0]
-            
-            cur.execute("SELECT COUNT(*) FROM users WHERE role = 'customer'")
-            total_customers = cur.fetchone()[0]
-            
-            cur.execute("""
-                SELECT COUNT(*) 
-                FROM orders 
-                WHERE created_at >= CURRENT_DATE - INTERVAL '30 days'
+                    COALESCE(SUM(total_orders), 0),
+                    COALESCE(SUM(total_revenue), 0),
+                    (SELECT COUNT(*) FROM users WHERE role = 'customer'),
+                    COALESCE(SUM(total_orders) FILTER (WHERE date >= CURRENT_DATE - 30), 0),
+                    COALESCE(SUM(total_revenue) FILTER (WHERE date >= CURRENT_DATE - 30), 0),
+                    (SELECT COUNT(*) FROM products)
+                FROM analytics_daily
             """)
-            orders_last_month = cur.fetchone()[0]
+            total_orders, total_revenue, total_customers, orders_last_month, revenue_last_month, total_products = cur.fetchone()
             
-            cur.execute("""
-                SELECT COALESCE(SUM(total_amount), 0)
-                FROM orders
-                WHERE created_at >= CURRENT_DATE - INTERVAL '30 days'
-            """)
-            revenue_last_month = cur.fetchone()[0]
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'total_orders': orders_stats[0] or 0,
-                    'total_revenue': orders_stats[1] or 0,
-                    'avg_order_value': int(orders_stats[2] or 0),
-                    'total_products': total_products,
-                    'total_customers': total_customers,
-                    'orders_last_month': orders_last_month,
-                    'revenue_last_month': revenue_last_month
-                }, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(200, {
+                'total_orders': total_orders,
+                'total_revenue': total_revenue,
+                'avg_order_value': total_revenue // total_orders if total_orders else 0,
+                'total_products': total_products,
+                'total_customers': total_customers,
+                'orders_last_month': orders_last_month,
+                'revenue_last_month': revenue_last_month
+            })
         
         elif path == 'customers' and method == 'GET':
             customer_id = params.get('id')
@@ -91,7 +572,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 cur.execute("""
                     SELECT c.id, u.email, u.full_name, u.phone, c.company_name, c.address,
                            c.notes, c.discount_percent, c.total_orders, c.total_spent,
-                           c.last_order_date, c.status, c.created_at
+                           c.last_order_date, c.status, c.created_at, c.price_list_id
                     FROM customers c
                     JOIN users u ON c.user_id = u.id
                     WHERE c.id = %s
@@ -99,96 +580,172 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 row = cur.fetchone()
                 
                 if not row:
-                    return {
-                        'statusCode': 404,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Customer not found'}, ensure_ascii=False),
-                        'isBase64Encoded': False
-                    }
+                    return error_response(404, 'Customer not found')
                 
                 customer = {
                     'id': row[0], 'email': row[1], 'full_name': row[2], 'phone': row[3],
                     'company_name': row[4], 'address': row[5], 'notes': row[6],
                     'discount_percent': row[7], 'total_orders': row[8], 'total_spent': row[9],
                     'last_order_date': row[10].isoformat() if row[10] else None,
-                    'status': row[11], 'created_at': row[12].isoformat() if row[12] else None
+                    'status': row[11], 'created_at': row[12].isoformat() if row[12] else None,
+                    'price_list_id': row[13]
                 }
                 
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps(customer, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
+                return json_response(200, customer)
             
-            cur.execute("""
-                SELECT c.id, u.email, u.full_name, u.phone, c.total_orders, c.total_spent,
-                       c.status, c.last_order_date
-                FROM customers c
-                JOIN users u ON c.user_id = u.id
-                ORDER BY c.total_spent DESC
-                LIMIT 100
-            """)
-            
-            customers = []
-            for row in cur.fetchall():
-                customers.append({
-                    'id': row[0], 'email': row[1], 'full_name': row[2], 'phone': row[3],
-                    'total_orders': row[4], 'total_spent': row[5], 'status': row[6],
-                    'last_order_date': row[7].isoformat() if row[7] else None
-                })
+            paginated = any(params.get(key) for key in CUSTOMER_LIST_PARAMS)
+            try:
+                limit = parse_limit(params.get('limit'), CUSTOMERS_DEFAULT_LIMIT, CUSTOMERS_MAX_LIMIT) if paginated else CUSTOMERS_LEGACY_LIMIT
+                page = list_customers(cur, params, limit)
+            except (ValueError, TypeError) as e:
+                return error_response(400, str(e))
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(customers, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(200, page if paginated else page['items'])
         
         elif path == 'customers' and method == 'PUT':
             customer_id = params.get('id')
             if not customer_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Customer ID required'}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
+                return error_response(400, 'Customer ID required')
+            
+            try:
+                customer_id = int(customer_id)
+            except ValueError:
+                return error_response(400, 'Invalid customer ID')
             
             body_data = json.loads(event.get('body', '{}'))
             
+            set_price_list = 'price_list_id' in body_data
+            price_list_id = body_data.get('price_list_id')
+            if price_list_id is not None:
+                if not isinstance(price_list_id, int) or isinstance(price_list_id, bool):
+                    return error_response(400, 'price_list_id must be an integer or null')
+                cur.execute("SELECT 1 FROM price_lists WHERE id = %s", (price_list_id,))
+                if not cur.fetchone():
+                    return error_response(400, 'Unknown price list')
+            
             cur.execute("""
                 UPDATE customers
-                SET company_name = %s, address = %s, notes = %s, discount_percent = %s,
-                    status = %s, updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s
-            """, (
-                body_data.get('company_name'), body_data.get('address'),
-                body_data.get('notes'), body_data.get('discount_percent', 0),
-                body_data.get('status', 'active'), customer_id
-            ))
+                SET company_name = %(company_name)s, address = %(address)s, notes = %(notes)s,
+                    discount_percent = %(discount_percent)s, status = %(status)s,
+                    price_list_id = CASE WHEN %(set_price_list)s THEN %(price_list_id)s ELSE price_list_id END,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = %(id)s
+            """, {
+                'company_name': body_data.get('company_name'), 'address': body_data.get('address'),
+                'notes': body_data.get('notes'), 'discount_percent': body_data.get('discount_percent', 0),
+                'status': body_data.get('status', 'active'), 'set_price_list': set_price_list,
+                'price_list_id': price_list_id, 'id': customer_id
+            })
+            if cur.rowcount == 0:
+                return error_response(404, 'Customer not found')
+            pricing.refresh_customer_prices(cur, customer_ids=[customer_id])
             conn.commit()
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'message': 'Customer updated'}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(200, {'message': 'Customer updated'})
+        
+        elif path == 'price_lists' and method == 'GET':
+            price_list_id = params.get('id')
+            
+            if price_list_id:
+                cur.execute("""
+                    SELECT id, name, description, discount_percent, valid_from, valid_to, is_active
+                    FROM price_lists WHERE id = %s
+                """, (price_list_id,))
+                row = cur.fetchone()
+                if not row:
+                    return error_response(404, 'Price list not found')
+                
+                cur.execute("""
+                    SELECT i.product_id, p.name, p.price, i.custom_price
+                    FROM price_list_items i
+                    JOIN products p ON p.id = i.product_id
+                    WHERE i.price_list_id = %s
+                    ORDER BY p.name
+                """, (price_list_id,))
+                items = [
+                    {'product_id': r[0], 'product_name': r[1], 'base_price': r[2], 'custom_price': r[3]}
+                    for r in cur.fetchall()
+                ]
+                
+                return json_response(200, {
+                    'id': row[0], 'name': row[1], 'description': row[2], 'discount_percent': row[3],
+                    'valid_from': row[4].isoformat() if row[4] else None,
+                    'valid_to': row[5].isoformat() if row[5] else None,
+                    'is_active': row[6], 'items': items,
+                    'customers': price_list_customers(cur, int(price_list_id))
+                })
+            
+            cur.execute("""
+                SELECT l.id, l.name, l.discount_percent, l.valid_from, l.valid_to, l.is_active,
+                       (SELECT COUNT(*) FROM price_list_items i WHERE i.price_list_id = l.id),
+                       (SELECT COUNT(*) FROM customers c WHERE c.price_list_id = l.id)
+                FROM price_lists l
+                ORDER BY l.name
+            """)
+            
+            price_lists = []
+            for row in cur.fetchall():
+                price_lists.append({
+                    'id': row[0], 'name': row[1], 'discount_percent': row[2],
+                    'valid_from': row[3].isoformat() if row[3] else None,
+                    'valid_to': row[4].isoformat() if row[4] else None,
+                    'is_active': row[5], 'items_count': row[6], 'customers_count': row[7]
+                })
+            
+            return json_response(200, price_lists)
+        
+        elif path == 'price_lists' and method in ('POST', 'PUT'):
+            try:
+                price_list = parse_price_list(json.loads(event.get('body') or '{}'))
+            except ValueError as e:
+                return error_response(400, str(e))
+            if price_list['items']:
+                missing = missing_products(cur, [item['product_id'] for item in price_list['items']])
+                if missing:
+                    return error_response(400, 'Unknown products', missing=missing)
+            
+            values = (
+                price_list['name'], price_list['description'], price_list['discount_percent'],
+                price_list['valid_from'], price_list['valid_to'], price_list['is_active']
+            )
+            if method == 'POST':
+                cur.execute("""
+                    INSERT INTO price_lists (name, description, discount_percent, valid_from, valid_to, is_active)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    RETURNING id
+                """, values)
+                price_list_id = cur.fetchone()[0]
+            else:
+                if not params.get('id'):
+                    return error_response(400, 'Price list ID required')
+                price_list_id = int(params['id'])
+                cur.execute("""
+                    UPDATE price_lists
+                    SET name = %s, description = %s, discount_percent = %s,
+                        valid_from = %s, valid_to = %s, is_active = %s
+                    WHERE id = %s
+                """, values + (price_list_id,))
+                if cur.rowcount == 0:
+                    return error_response(404, 'Price list not found')
+            
+            if price_list['items'] is not None:
+                save_price_list_items(cur, price_list_id, price_list['items'])
+            customers = price_list_customers(cur, price_list_id)
+            if customers:
+                pricing.refresh_customer_prices(cur, customer_ids=customers)
+            conn.commit()
+            
+            return json_response(201 if method == 'POST' else 200, {'id': price_list_id, 'customers': len(customers)})
         
         elif path == 'sales':
             days = int(params.get('days', 30))
             
             cur.execute("""
-                SELECT 
-                    DATE(created_at) as date,
-                    COUNT(*) as orders_count,
-                    COALESCE(SUM(total_amount), 0) as revenue
-                FROM orders
-                WHERE created_at >= CURRENT_DATE - INTERVAL '%s days'
-                GROUP BY DATE(created_at)
+                SELECT date, total_orders, total_revenue
+                FROM analytics_daily
+                WHERE date >= CURRENT_DATE - %s AND total_orders > 0
                 ORDER BY date
-            """ % days)
+            """, (days,))
             
             sales_data = []
             for row in cur.fetchall():
@@ -198,27 +755,64 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'revenue': row[2]
                 })
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(sales_data, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(200, sales_data)
+        
+        elif path == 'analytics/rebuild' and method == 'POST':
+            days = params.get('days')
+            rows = rebuild_analytics(cur, int(days) if days else None)
+            conn.commit()
+            
+            return json_response(200, {'message': 'Analytics rebuilt', 'days': rows})
+        
+        elif path == 'customers/rebuild' and method == 'POST':
+            try:
+                batch_size = parse_int_param(params.get('batch_size'), 'batch_size', CUSTOMER_STATS_BATCH_SIZE, maximum=5000)
+                max_batches = parse_int_param(params.get('max_batches'), 'max_batches', 100)
+                after_id = parse_int_param(params.get('after_id'), 'after_id', 0, minimum=0)
+            except ValueError as e:
+                return error_response(400, str(e))
+            
+            result = rebuild_customer_stats(conn, cur, batch_size, max_batches, after_id)
+            
+            return json_response(200, dict(result, message='Customer stats rebuilt'))
+        
+        elif path == 'products/stats/rebuild' and method == 'POST':
+            rows = rebuild_product_stats(cur)
+            conn.commit()
+            
+            return json_response(200, {'message': 'Product stats rebuilt', 'products': rows})
         
         elif path == 'products/stats':
-            cur.execute("""
-                SELECT 
-                    p.name,
-                    p.category,
-                    COUNT(oi.id) as times_ordered,
-                    COALESCE(SUM(oi.quantity), 0) as total_quantity,
-                    COALESCE(SUM(oi.quantity * oi.price), 0) as total_revenue
-                FROM products p
-                LEFT JOIN order_items oi ON p.id = oi.product_id
-                GROUP BY p.id, p.name, p.category
-                ORDER BY total_revenue DESC NULLS LAST
-                LIMIT 10
-            """)
+            days = params.get('days')
+            if days and int(days) not in STATS_WINDOWS:
+                return error_response(400, 'days must be one of 7, 30, 365')
+            
+            if days:
+                cur.execute("""
+                    SELECT p.name, p.category, s.times_ordered, s.total_quantity, s.total_revenue, s.last_sold
+                    FROM (
+                        SELECT product_id,
+                               SUM(times_ordered) AS times_ordered,
+                               SUM(quantity) AS total_quantity,
+                               SUM(revenue)::BIGINT AS total_revenue,
+                               MAX(date) AS last_sold
+                        FROM product_sales_daily
+                        WHERE date >= CURRENT_DATE - %s
+                        GROUP BY product_id
+                        ORDER BY total_revenue DESC
+                        LIMIT 10
+                    ) s
+                    JOIN products p ON p.id = s.product_id
+                    ORDER BY s.total_revenue DESC
+                """, (int(days),))
+            else:
+                cur.execute("""
+                    SELECT p.name, p.category, s.times_ordered, s.total_quantity, s.total_revenue, s.last_sold_at
+                    FROM product_sales_summary s
+                    JOIN products p ON p.id = s.product_id
+                    ORDER BY s.total_revenue DESC
+                    LIMIT 10
+                """)
             
             products = []
             for row in cur.fetchall():
@@ -227,63 +821,76 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'category': row[1],
                     'times_ordered': row[2] or 0,
                     'total_quantity': row[3] or 0,
-                    'total_revenue': row[4] or 0
+                    'total_revenue': row[4] or 0,
+                    'last_sold': row[5].isoformat() if row[5] else None
                 })
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(products, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(200, products)
         
         elif path == 'export':
             export_format = params.get('format', 'csv')
+            compress = params.get('compress') == 'gzip'
+            categories = [c for c in (params.get('category') or '').split(',') if c]
             
-            if export_format == 'csv':
-                cur.execute("""
-                    SELECT name, category, price, stock, description
-                    FROM products
-                    ORDER BY category, name
-                """)
-                
-                output = io.StringIO()
-                writer = csv.writer(output)
-                writer.writerow(['Название', 'Категория', 'Цена (₽)', 'Наличие', 'Описание'])
-                
-                for row in cur.fetchall():
-                    category_map = {
-                        'peonies': 'Пионы', 'clematis': 'Клематисы',
-                        'shrubs': 'Кустарники', 'seeds': 'Семена',
-                        'fertilizers': 'Удобрения', 'other': 'Другое'
-                    }
-                    writer.writerow([
-                        row[0], category_map.get(row[1], row[1]),
-                        row[2], row[3], row[4] or ''
-                    ])
-                
-                csv_content = output.getvalue()
-                output.close()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        'Content-Type': 'text/csv; charset=utf-8',
-                        'Content-Disposition': 'attachment; filename="pricelist.csv"',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': csv_content,
-                    'isBase64Encoded': False
-                }
+            if export_format not in ('csv', 'xlsx'):
+                return error_response(400, 'Unsupported format')
+            
+            rows = iter_export_rows(conn, categories)
+            output = io.BytesIO()
+            
+            if export_format == 'xlsx':
+                write_xlsx(rows, output)
+                content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+                filename = 'pricelist.xlsx'
+            elif compress:
+                with gzip.GzipFile(fileobj=output, mode='wb') as gz:
+                    write_csv(rows, gz)
+                content_type = 'application/gzip'
+                filename = 'pricelist.csv.gz'
+            else:
+                write_csv(rows, output)
+                content_type = 'text/csv; charset=utf-8'
+                filename = 'pricelist.csv'
+            
+            content = output.getvalue()
+            output.close()
+            disposition = {'Content-Disposition': 'attachment; filename="%s"' % filename}
+            
+            if export_format == 'xlsx' or compress:
+                return binary_response(200, content, content_type, disposition)
+            return body_response(200, content.decode('utf-8'), disposition, content_type)
+        
+        elif path == 'import' and method == 'POST':
+            import_format = params.get('format', 'csv')
+            if import_format not in ('csv', 'json'):
+                return error_response(400, 'Unsupported format')
+            
+            dry_run = params.get('dry_run') == '1'
+            try:
+                raw = read_body_bytes(event)
+                rows = parse_import_csv(raw) if import_format == 'csv' else parse_import_json(raw)
+                result = import_products(cur, rows)
+                product_ids = result.pop('product_ids')
+                if product_ids and not dry_run:
+                    pricing.refresh_customer_prices(cur, product_ids=product_ids)
+            except OverflowError as e:
+                conn.rollback()
+                return error_response(413, str(e))
+            except (ValueError, OSError, csv.Error, psycopg2.DataError) as e:
+                conn.rollback()
+                return error_response(400, str(e).strip())
+            
+            result['dry_run'] = dry_run
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+            
+            return json_response(200, result)
         
         else:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Invalid path'}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return error_response(400, 'Invalid path')
     
     finally:
         cur.close()
-        conn.close()
+        db.release(conn)
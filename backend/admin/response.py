@@ -0,0 +1,290 @@
+"""
+Общий слой HTTP-ответов облачных функций: JSON, CORS, кэширование и сжатие.
+
+Как и db.py, модуль лежит одинаковой копией в каждой backend/<функция>/response.py.
+
+Обработчик оборачивается в @http_handler и возвращает json_response/error_response/...;
+обёртка сжимает тела длиннее COMPRESS_MIN_BYTES по Accept-Encoding (br, gzip) в base64
+и проставляет Cache-Control: no-store, если обработчик не задал свой. Кроме того, она
+трассирует запросы к базе (db.start_trace), добавляет заголовок Server-Timing и пишет
+в stdout одну JSON-строку на вызов; превышение db.QUERY_BUDGET отмечается level=warning
+со списком повторяющихся запросов.
+
+Здесь же разбор общих для функций частей запроса (токен сессии, ETag/If-None-Match,
+limit и курсоры keyset-пагинации), чтобы их копии не расходились между функциями.
+"""
+import base64
+import functools
+import gzip
+import hashlib
+import json
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+import db
+
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+DEFAULT_CACHE_CONTROL = 'no-store'
+CORS_HEADERS = {'Access-Control-Allow-Origin': '*'}
+
+UNCOMPRESSIBLE_TYPES = ('application/gzip', 'application/zip', 'application/vnd.openxmlformats')
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError('Object of type %s is not JSON serializable' % type(value).__name__)
+
+
+def dumps(data: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(data, ensure_ascii=False, default=_default)
+
+
+def body_response(status_code: int, body: str, headers: Optional[Dict[str, str]] = None,
+                  content_type: str = 'application/json') -> Dict[str, Any]:
+    response_headers = {'Content-Type': content_type, **CORS_HEADERS}
+    if headers:
+        response_headers.update(headers)
+    return {
+        'statusCode': status_code,
+        'headers': response_headers,
+        'body': body,
+        'isBase64Encoded': False
+    }
+
+
+def json_response(status_code: int, data: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return body_response(status_code, dumps(data), headers)
+
+
+def error_response(status_code: int, message: str, **extra: Any) -> Dict[str, Any]:
+    return json_response(status_code, dict({'error': message}, **extra))
+
+
+def binary_response(status_code: int, content: bytes, content_type: str,
+                    headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    response = body_response(status_code, base64.b64encode(content).decode('ascii'), headers, content_type)
+    response['isBase64Encoded'] = True
+    return response
+
+
+def options_response(methods: str, allow_headers: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 200,
+        'headers': {
+            **CORS_HEADERS,
+            'Access-Control-Allow-Methods': methods,
+            'Access-Control-Allow-Headers': allow_headers,
+            'Access-Control-Max-Age': '86400'
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+
+def get_auth_token(event: Dict[str, Any]) -> Optional[str]:
+    headers = event.get('headers') or {}
+    return headers.get('x-auth-token') or headers.get('X-Auth-Token')
+
+
+ADMIN_ROLE_SQL = """
+    SELECT u.role
+    FROM sessions s
+    JOIN users u ON u.id = s.user_id
+    WHERE s.token = %s AND s.expires_at > CURRENT_TIMESTAMP AND u.is_active
+"""
+
+
+def require_admin(cur, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Проверяет, что X-Auth-Token - действующая сессия пользователя с role = 'admin'.
+    Возвращает None, если доступ есть, иначе готовый ответ: 401 без сессии, 403 не администратору.
+    """
+    token = get_auth_token(event)
+    if not token:
+        return error_response(401, 'No token provided')
+    cur.execute(ADMIN_ROLE_SQL, (token,))
+    row = cur.fetchone()
+    if row is None:
+        return error_response(401, 'Invalid or expired token')
+    if row[0] != 'admin':
+        return error_response(403, 'Admin access required')
+    return None
+
+
+def make_etag(body: str) -> str:
+    return '"%s"' % hashlib.sha1(body.encode('utf-8')).hexdigest()[:20]
+
+
+def etag_matches(headers: Dict[str, Any], etag: str) -> bool:
+    if_none_match: Optional[str] = headers.get('if-none-match') or headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or 'W/' + etag in candidates
+
+
+def parse_limit(raw: Optional[str], default: int, maximum: int) -> int:
+    """Размер страницы из параметра запроса: по умолчанию default, не больше maximum."""
+    if not raw:
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ValueError('Invalid limit')
+    return max(1, min(limit, maximum))
+
+
+def parse_int_param(raw: Optional[str], name: str, default: int,
+                    minimum: int = 1, maximum: Optional[int] = None) -> int:
+    """Целый параметр запроса: по умолчанию default, не меньше minimum (иначе ValueError), не больше maximum."""
+    if raw is None or raw == '':
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError('Invalid %s' % name)
+    if value < minimum:
+        raise ValueError('Invalid %s' % name)
+    return min(value, maximum) if maximum is not None else value
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Курсор keyset-пагинации: base64 от JSON-списка значений ключа последней строки.
+    datetime пишется в ISO, а datetime.min (так psycopg2 читает -infinity) - строкой '-infinity'.
+    """
+    raw = json.dumps([
+        ('-infinity' if value == datetime.min else value.isoformat()) if isinstance(value, datetime) else value
+        for value in values
+    ])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def cursor_datetime(value: str) -> Any:
+    """Дата из курсора: datetime или '-infinity' как есть (Postgres приведёт строку к TIMESTAMP)."""
+    return value if value == '-infinity' else datetime.fromisoformat(value)
+
+
+def decode_cursor(cursor: str, *types: Callable[[Any], Any]) -> List[Any]:
+    """Разбирает курсор encode_cursor, приводя каждое значение своей функцией из types."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError
+        return [cast(value) for cast, value in zip(types, values)]
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Выбирает br или gzip по заголовку Accept-Encoding с учётом q-значений."""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None:
+            continue
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > 0:
+            return encoding
+    return None
+
+
+def compress(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    headers = response.setdefault('headers', {})
+    headers.setdefault('Cache-Control', DEFAULT_CACHE_CONTROL)
+
+    body = response.get('body') or ''
+    if response.get('isBase64Encoded') or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    if headers.get('Content-Type', '').startswith(UNCOMPRESSIBLE_TYPES):
+        return response
+
+    request_headers = event.get('headers') or {}
+    accept_encoding = request_headers.get('accept-encoding') or request_headers.get('Accept-Encoding') or ''
+    headers['Vary'] = 'Accept-Encoding'
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return response
+
+    raw = body.encode('utf-8')
+    if encoding == 'br':
+        packed = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        packed = gzip.compress(raw, compresslevel=GZIP_LEVEL)
+
+    headers['Content-Encoding'] = encoding
+    response['body'] = base64.b64encode(packed).decode('ascii')
+    response['isBase64Encoded'] = True
+    return response
+
+
+def server_timing(trace: db.QueryTrace, total_ms: float) -> str:
+    return 'db;dur=%.1f;desc="%d queries", total;dur=%.1f' % (trace.total_ms, trace.count, total_ms)
+
+
+def log_invocation(event: Dict[str, Any], context: Any, status_code: int,
+                   total_ms: float, trace: db.QueryTrace) -> None:
+    params = event.get('queryStringParameters') or {}
+    record = {
+        'level': 'warning' if trace.over_budget else 'info',
+        'function': getattr(context, 'function_name', None),
+        'request_id': getattr(context, 'request_id', None),
+        'method': event.get('httpMethod'),
+        'action': params.get('action') or params.get('path'),
+        'status': status_code,
+        'duration_ms': round(total_ms, 2),
+        'db_ms': round(trace.total_ms, 2),
+        'queries': trace.count,
+        'slowest': trace.slowest()
+    }
+    if trace.over_budget:
+        record['query_budget'] = db.QUERY_BUDGET
+        record['repeated'] = trace.repeated()
+    sys.stdout.write(dumps(record) + '\n')
+    sys.stdout.flush()
+
+
+def http_handler(fn: Callable[[Dict[str, Any], Any], Dict[str, Any]]) -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
+    @functools.wraps(fn)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        started = time.perf_counter()
+        trace = db.start_trace()
+        status_code = 500
+        try:
+            response = compress(event, fn(event, context))
+            status_code = response.get('statusCode', 200)
+            response['headers']['Server-Timing'] = server_timing(trace, (time.perf_counter() - started) * 1000)
+            response['headers']['Timing-Allow-Origin'] = '*'
+            return response
+        finally:
+            db.finish_trace()
+            log_invocation(event, context, status_code, (time.perf_counter() - started) * 1000, trace)
+    return wrapper
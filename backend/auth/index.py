@@ -1,10 +1,73 @@
 import json
 import os
-import psycopg2
 import secrets
 import hashlib
-from datetime import datetime, timedelta
-from typing import Dict, Any
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import db
+from response import http_handler, json_response, error_response, options_response, get_auth_token, require_admin, parse_int_param
+
+SESSION_CACHE_TTL = float(os.environ.get('SESSION_CACHE_TTL', '30'))
+SESSION_CACHE_MAX_SIZE = int(os.environ.get('SESSION_CACHE_MAX_SIZE', '10000'))
+PURGE_BATCH_SIZE = 1000
+PURGE_MAX_BATCHES = 50
+
+class SessionCache:
+    """
+    LRU-кэш проверенных сессий: токен -> пользователь. Попадание в кэш не обращается к базе.
+    Запись живёт не дольше ttl секунд и не дольше самой сессии: оставшийся срок сессии считается
+    по часам базы при проверке, а в кэше хранится как момент time.monotonic(), так что часы
+    и часовой пояс экземпляра ни на что не влияют. logout удаляет запись сразу, но только
+    в своём экземпляре: на других тёплых экземплярах отозванный токен принимается ещё
+    не дольше ttl секунд. Столько же видны с задержкой изменения пользователя.
+    """
+    
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                user, cached_until = entry
+                if time.monotonic() < cached_until:
+                    self._entries.move_to_end(token)
+                    self.hits += 1
+                    return user
+                del self._entries[token]
+            self.misses += 1
+            return None
+    
+    def put(self, token: str, user: Dict[str, Any], expires_in: float) -> None:
+        """expires_in - сколько секунд сессии осталось по часам базы."""
+        with self._lock:
+            self._entries[token] = (user, time.monotonic() + min(self.ttl, expires_in))
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(token, None)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'size': len(self._entries), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions
+            }
+
+session_cache = SessionCache(SESSION_CACHE_TTL, SESSION_CACHE_MAX_SIZE)
 
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
@@ -12,92 +75,109 @@ def hash_password(password: str) -> str:
 def generate_token() -> str:
     return secrets.token_urlsafe(32)
 
-def generate_referral_code(user_id: int) -> str:
-    return f"BAL{user_id:05d}"
+REGISTER_SQL = """
+    WITH new_id AS (
+        SELECT nextval(pg_get_serial_sequence('users', 'id')) AS id
+    ), new_user AS (
+        INSERT INTO users (id, email, password_hash, full_name, phone, role, referral_code, referred_by)
+        SELECT id, %(email)s, %(password_hash)s, %(full_name)s, %(phone)s, 'customer',
+               'BAL' || LPAD(id::text, GREATEST(5, LENGTH(id::text)), '0'), %(referred_by)s
+        FROM new_id
+        ON CONFLICT (email) DO NOTHING
+        RETURNING id, referral_code, referred_by
+    ), referral AS (
+        INSERT INTO referrals (referrer_id, referred_id, bonus_amount)
+        SELECT referred_by, id, 500 FROM new_user WHERE referred_by IS NOT NULL
+    ), customer AS (
+        INSERT INTO customers (user_id) SELECT id FROM new_user
+    ), daily AS (
+        INSERT INTO analytics_daily (date, new_customers)
+        SELECT CURRENT_DATE, 1 FROM new_user
+        ON CONFLICT (date) DO UPDATE SET new_customers = analytics_daily.new_customers + 1
+    )
+    SELECT id, referral_code FROM new_user
+"""
+
+def purge_expired_sessions(conn, cur, batch_size: int, max_batches: int) -> int:
+    """Удаляет истёкшие сессии порциями по batch_size, фиксируя каждую порцию отдельно."""
+    deleted = 0
+    for _ in range(max_batches):
+        cur.execute(
+            "DELETE FROM sessions WHERE id IN ("
+            "SELECT id FROM sessions WHERE expires_at < CURRENT_TIMESTAMP "
+            "ORDER BY expires_at LIMIT %s FOR UPDATE SKIP LOCKED)",
+            (batch_size,)
+        )
+        conn.commit()
+        deleted += cur.rowcount
+        if cur.rowcount < batch_size:
+            break
+    return deleted
+
+def user_response(user: Dict[str, Any]) -> Dict[str, Any]:
+    return json_response(200, user)
 
+@http_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     API для авторизации и регистрации
     POST /register - регистрация нового пользователя
     POST /login - вход в систему
     POST /logout - выход из системы
-    GET /me - получить текущего пользователя по токену
+    GET /me - получить текущего пользователя по токену (из кэша сессий, если он свежий)
+    GET /?action=cache_stats - счётчики кэша сессий (админ)
+    POST /?action=purge_sessions&batch_size=1000&max_batches=50 - удалить истёкшие сессии порциями (админ)
     """
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return options_response('GET, POST, OPTIONS', 'Content-Type, X-Auth-Token')
     
-    dsn = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(dsn)
+    params = event.get('queryStringParameters') or {}
+    action = params.get('action', '')
+    
+    if method == 'GET' and action != 'cache_stats':
+        token = get_auth_token(event)
+        cached_user = session_cache.get(token) if token else None
+        if cached_user:
+            return user_response(cached_user)
+    
+    conn = db.acquire()
     cur = conn.cursor()
     
     try:
-        params = event.get('queryStringParameters') or {}
-        action = params.get('action', '')
         
-        if method == 'POST' and action == 'register':
-            body_data = json.loads(event.get('body', '{}'))
-            
-            cur.execute("SELECT id FROM users WHERE email = %s", (body_data['email'],))
-            if cur.fetchone():
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Email already exists'}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
-            
-            password_hash = hash_password(body_data['password'])
-            referral_code_temp = secrets.token_hex(4).upper()
+        if method == 'GET' and action == 'cache_stats':
+            denied = require_admin(cur, event)
+            if denied:
+                return denied
             
-            cur.execute(
-                "INSERT INTO users (email, password_hash, full_name, phone, role, referral_code, referred_by) "
-                "VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id",
-                (
-                    body_data['email'], password_hash, body_data.get('full_name', ''),
-                    body_data.get('phone', ''), 'customer', referral_code_temp,
-                    body_data.get('referred_by')
-                )
-            )
-            user_id = cur.fetchone()[0]
-            
-            referral_code = generate_referral_code(user_id)
-            cur.execute("UPDATE users SET referral_code = %s WHERE id = %s", (referral_code, user_id))
+            return json_response(200, session_cache.stats())
+        
+        elif method == 'POST' and action == 'register':
+            body_data = json.loads(event.get('body', '{}'))
             
-            if body_data.get('referred_by'):
-                cur.execute(
-                    "INSERT INTO referrals (referrer_id, referred_id, bonus_amount) VALUES (%s, %s, %s)",
-                    (body_data['referred_by'], user_id, 500)
-                )
+            cur.execute(REGISTER_SQL, {
+                'email': body_data['email'],
+                'password_hash': hash_password(body_data['password']),
+                'full_name': body_data.get('full_name', ''),
+                'phone': body_data.get('phone', ''),
+                'referred_by': body_data.get('referred_by')
+            })
+            created = cur.fetchone()
             
-            cur.execute(
-                "INSERT INTO customers (user_id) VALUES (%s)",
-                (user_id,)
-            )
+            if not created:
+                conn.rollback()
+                return error_response(400, 'Email already exists')
             
+            user_id, referral_code = created
             conn.commit()
             
-            return {
-                'statusCode': 201,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'message': 'User registered successfully',
-                    'user_id': user_id,
-                    'referral_code': referral_code
-                }, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(201, {
+                'message': 'User registered successfully',
+                'user_id': user_id,
+                'referral_code': referral_code
+            })
         
         elif method == 'POST' and action == 'login':
             body_data = json.loads(event.get('body', '{}'))
@@ -112,104 +192,84 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             user = cur.fetchone()
             
             if not user:
-                return {
-                    'statusCode': 401,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Invalid credentials'}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
+                return error_response(401, 'Invalid credentials')
             
             token = generate_token()
-            expires_at = datetime.now() + timedelta(days=30)
             
             cur.execute(
-                "INSERT INTO sessions (user_id, token, expires_at) VALUES (%s, %s, %s)",
-                (user[0], token, expires_at)
+                "INSERT INTO sessions (user_id, token, expires_at) "
+                "VALUES (%s, %s, CURRENT_TIMESTAMP + INTERVAL '30 days')",
+                (user[0], token)
             )
             conn.commit()
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'token': token,
-                    'user': {
-                        'id': user[0],
-                        'email': user[1],
-                        'full_name': user[2],
-                        'role': user[3],
-                        'referral_code': user[4]
-                    }
-                }, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(200, {
+                'token': token,
+                'user': {
+                    'id': user[0],
+                    'email': user[1],
+                    'full_name': user[2],
+                    'role': user[3],
+                    'referral_code': user[4]
+                }
+            })
         
         elif method == 'POST' and action == 'logout':
-            headers = event.get('headers') or {}
-            token = headers.get('x-auth-token') or headers.get('X-Auth-Token')
+            token = get_auth_token(event)
             
             if token:
+                session_cache.invalidate(token)
                 cur.execute("UPDATE sessions SET expires_at = CURRENT_TIMESTAMP WHERE token = %s", (token,))
                 conn.commit()
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'message': 'Logged out successfully'}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(200, {'message': 'Logged out successfully'})
         
-        elif method == 'GET':
-            headers = event.get('headers') or {}
-            token = headers.get('x-auth-token') or headers.get('X-Auth-Token')
+        elif method == 'POST' and action == 'purge_sessions':
+            denied = require_admin(cur, event)
+            if denied:
+                return denied
+            
+            try:
+                batch_size = parse_int_param(params.get('batch_size'), 'batch_size', PURGE_BATCH_SIZE, maximum=10000)
+                max_batches = parse_int_param(params.get('max_batches'), 'max_batches', PURGE_MAX_BATCHES)
+            except ValueError as e:
+                return error_response(400, str(e))
             
+            deleted = purge_expired_sessions(conn, cur, batch_size, max_batches)
+            
+            return json_response(200, {'message': 'Expired sessions purged', 'deleted': deleted})
+        
+        elif method == 'GET':
             if not token:
-                return {
-                    'statusCode': 401,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'No token provided'}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
+                return error_response(401, 'No token provided')
             
             cur.execute(
-                "SELECT u.id, u.email, u.full_name, u.role, u.referral_code, u.phone "
+                "SELECT u.id, u.email, u.full_name, u.role, u.referral_code, u.phone, "
+                "EXTRACT(EPOCH FROM s.expires_at - CURRENT_TIMESTAMP) "
                 "FROM users u "
                 "JOIN sessions s ON u.id = s.user_id "
                 "WHERE s.token = %s AND s.expires_at > CURRENT_TIMESTAMP",
                 (token,)
             )
-            user = cur.fetchone()
+            row = cur.fetchone()
             
-            if not user:
-                return {
-                    'statusCode': 401,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Invalid or expired token'}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
+            if not row:
+                return error_response(401, 'Invalid or expired token')
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'id': user[0],
-                    'email': user[1],
-                    'full_name': user[2],
-                    'role': user[3],
-                    'referral_code': user[4],
-                    'phone': user[5]
-                }, ensure_ascii=False),
-                'isBase64Encoded': False
+            user = {
+                'id': row[0],
+                'email': row[1],
+                'full_name': row[2],
+                'role': row[3],
+                'referral_code': row[4],
+                'phone': row[5]
             }
+            session_cache.put(token, user, float(row[6]))
+            return user_response(user)
         
         else:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Invalid action'}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return error_response(400, 'Invalid action')
     
     finally:
         cur.close()
-        conn.close()
+        db.release(conn)
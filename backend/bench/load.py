@@ -0,0 +1,320 @@
+"""
+Нагрузочный прогон бэкенда через локальный dev_server.py.
+
+Сценарии:
+  tests     - все запросы из backend/*/tests.json с проверкой expectedStatus/expectedBody
+  catalog   - просмотр каталога: списки, категории, страницы, поиск, карточки товаров
+  checkout  - расчёт корзины и оформление заказов на 1-20 позиций
+  dashboard - обновление админ-дашборда: сводка, продажи, клиенты, популярные товары
+  auth      - проверка сессии GET /me по токенам bench-token-<n> из seed.py
+
+Для каждого сценария печатаются запросы/с, p50/p95/p99 и, если задан DATABASE_URL и
+установлено расширение pg_stat_statements, число запросов к базе на HTTP-запрос.
+--write-baseline сохраняет результаты в JSON, --baseline сравнивает с ним и завершает
+процесс с кодом 1 при регрессии больше --tolerance.
+
+Запуск:
+  python backend/dev_server.py --workers 4 &
+  DATABASE_URL=postgresql://localhost/nursery_bench python backend/bench/load.py \\
+      --scenario catalog --scenario checkout --concurrency 32 --duration 30 --baseline bench.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CATEGORIES = ['peonies', 'clematis', 'shrubs', 'seeds', 'fertilizers', 'other']
+SEARCH_TERMS = ['пион', 'клематис белоснежный', 'пион сара бернар', 'гортензия', 'семена мальвы']
+
+Request = Tuple[str, str, Optional[Dict[str, Any]], Dict[str, str], Optional[Callable[[int, Any], bool]]]
+
+
+def load_test_scenarios() -> List[Request]:
+    requests: List[Request] = []
+    for name in sorted(os.listdir(BACKEND_DIR)):
+        path = os.path.join(BACKEND_DIR, name, 'tests.json')
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            for test in json.load(f).get('tests', []):
+                requests.append((
+                    test.get('method', 'GET'),
+                    '/' + name + test.get('path', '/').rstrip('/').replace(' ', '%20'),
+                    test.get('body'),
+                    test.get('headers', {}),
+                    make_checker(test)
+                ))
+    return requests
+
+
+def matches(expected: Any, actual: Any) -> bool:
+    """Частичное сравнение в духе tests.json: "number"/"string" проверяют тип, ключи "0" - индекс списка."""
+    if expected == 'number':
+        return isinstance(actual, (int, float)) and not isinstance(actual, bool)
+    if expected == 'string':
+        return isinstance(actual, str)
+    if isinstance(expected, dict):
+        for key, value in expected.items():
+            if isinstance(actual, list) and key.isdigit():
+                if int(key) >= len(actual) or not matches(value, actual[int(key)]):
+                    return False
+            elif not isinstance(actual, dict) or key not in actual or not matches(value, actual[key]):
+                return False
+        return True
+    return expected == actual
+
+
+def make_checker(test: Dict[str, Any]) -> Callable[[int, Any], bool]:
+    def check(status: int, body: Any) -> bool:
+        if status != test.get('expectedStatus', 200):
+            return False
+        return 'expectedBody' not in test or matches(test['expectedBody'], body)
+    return check
+
+
+def uniquify(body: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if body and 'email' in body and 'password' in body:
+        return dict(body, email='bench-%s@example.com' % uuid.uuid4().hex)
+    return body
+
+
+def catalog_requests(rng: random.Random, product_count: int) -> Iterator[Request]:
+    while True:
+        roll = rng.random()
+        if roll < 0.3:
+            yield ('GET', '/products?category=' + rng.choice(CATEGORIES), None, {}, None)
+        elif roll < 0.5:
+            yield ('GET', '/products', None, {}, None)
+        elif roll < 0.7:
+            yield ('GET', '/products?limit=50&fields=id,name,price,image_url,badge,stock', None, {}, None)
+        elif roll < 0.85:
+            yield ('GET', '/products?q=' + quote(rng.choice(SEARCH_TERMS)), None, {}, None)
+        else:
+            yield ('GET', '/products?id=%d' % rng.randint(1, product_count), None, {}, None)
+
+
+def checkout_requests(rng: random.Random, product_count: int, user_count: int) -> Iterator[Request]:
+    while True:
+        items = [
+            {'product_id': rng.randint(1, product_count), 'product_name': '', 'quantity': rng.randint(1, 3), 'price': 0}
+            for _ in range(rng.randint(1, 20))
+        ]
+        headers = {'X-Auth-Token': 'bench-token-%d' % rng.randint(1, user_count)}
+        yield ('POST', '/orders?action=quote', {'items': items}, headers, None)
+        yield ('POST', '/orders', {
+            'customer_name': 'Нагрузка', 'customer_phone': '+70000000000', 'total_amount': 0, 'items': items
+        }, headers, None)
+
+
+def dashboard_requests(rng: random.Random) -> Iterator[Request]:
+    paths = ['/admin?path=dashboard', '/admin?path=sales&days=30', '/admin?path=customers',
+             '/admin?path=products/stats', '/admin?path=products/stats&days=30']
+    while True:
+        yield ('GET', rng.choice(paths), None, {}, None)
+
+
+def auth_requests(rng: random.Random, user_count: int) -> Iterator[Request]:
+    while True:
+        yield ('GET', '/auth', None, {'X-Auth-Token': 'bench-token-%d' % rng.randint(1, user_count)}, None)
+
+
+def cycle(requests: List[Request], rng: random.Random) -> Iterator[Request]:
+    while True:
+        for method, path, body, headers, check in rng.sample(requests, len(requests)):
+            yield (method, path, uniquify(body), headers, check)
+
+
+def make_generator(scenario: str, seed: int, args: argparse.Namespace) -> Iterator[Request]:
+    rng = random.Random(seed)
+    if scenario == 'tests':
+        return cycle(load_test_scenarios(), rng)
+    if scenario == 'catalog':
+        return catalog_requests(rng, args.products)
+    if scenario == 'checkout':
+        return checkout_requests(rng, args.products, args.users)
+    if scenario == 'dashboard':
+        return dashboard_requests(rng)
+    if scenario == 'auth':
+        return auth_requests(rng, args.users)
+    raise ValueError('Unknown scenario: ' + scenario)
+
+
+def worker(base_url: str, generator: Iterator[Request], deadline: float, max_requests: int,
+           latencies: List[float], errors: List[str], lock: threading.Lock) -> None:
+    parts = urlsplit(base_url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    local_latencies: List[float] = []
+    local_errors: List[str] = []
+    try:
+        while time.monotonic() < deadline and len(local_latencies) + len(local_errors) < max_requests:
+            method, path, body, headers, check = next(generator)
+            payload = json.dumps(body, ensure_ascii=False).encode('utf-8') if body is not None else None
+            request_headers = dict(headers, **({'Content-Type': 'application/json'} if payload else {}))
+            started = time.perf_counter()
+            try:
+                conn.request(method, path, body=payload, headers=request_headers)
+                response = conn.getresponse()
+                raw = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                local_errors.append('%s %s: %r' % (method, path, e))
+                continue
+            elapsed = (time.perf_counter() - started) * 1000
+
+            ok = response.status < 500
+            if check is not None:
+                try:
+                    ok = check(response.status, json.loads(raw) if raw else None)
+                except ValueError:
+                    ok = False
+            if ok:
+                local_latencies.append(elapsed)
+            else:
+                local_errors.append('%s %s -> %d' % (method, path, response.status))
+    finally:
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors.extend(local_errors)
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def query_counter() -> Optional[Callable[[], int]]:
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        return None
+    try:
+        import psycopg2
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'")
+        if not cur.fetchone():
+            conn.close()
+            return None
+    except Exception:
+        return None
+
+    def total_calls() -> int:
+        cur.execute(
+            "SELECT COALESCE(SUM(calls), 0) FROM pg_stat_statements "
+            "WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())"
+        )
+        return int(cur.fetchone()[0])
+    return total_calls
+
+
+def run_scenario(scenario: str, args: argparse.Namespace, count_queries: Optional[Callable[[], int]]) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+    per_worker = args.requests // args.concurrency if args.requests else sys.maxsize
+    deadline = time.monotonic() + args.duration
+
+    queries_before = count_queries() if count_queries else None
+    threads = [
+        threading.Thread(target=worker, args=(
+            args.url, make_generator(scenario, args.seed + i, args), deadline, per_worker, latencies, errors, lock
+        ))
+        for i in range(args.concurrency)
+    ]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    queries_after = count_queries() if count_queries else None
+
+    latencies.sort()
+    total = len(latencies) + len(errors)
+    result = {
+        'requests': total,
+        'errors': len(errors),
+        'throughput': round(total / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'queries_per_request': None
+    }
+    if queries_before is not None and total:
+        # два служебных запроса самого счётчика не относятся к нагрузке
+        result['queries_per_request'] = round((queries_after - queries_before - 2) / total, 2)
+    for message in errors[:5]:
+        print('  error: ' + message)
+    return result
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    regressions = []
+    for scenario, current in results.items():
+        base = baseline.get(scenario)
+        if not base:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request'):
+            if base.get(metric) and current.get(metric) is not None and current[metric] > base[metric] * (1 + tolerance):
+                regressions.append('%s %s: %s -> %s' % (scenario, metric, base[metric], current[metric]))
+        if base.get('throughput') and current['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append('%s throughput: %s -> %s' % (scenario, base['throughput'], current['throughput']))
+        if current['errors'] > base.get('errors', 0):
+            regressions.append('%s errors: %s -> %s' % (scenario, base.get('errors', 0), current['errors']))
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--scenario', action='append', choices=['tests', 'catalog', 'checkout', 'dashboard', 'auth'])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds per scenario')
+    parser.add_argument('--requests', type=int, default=0, help='stop after this many requests per scenario')
+    parser.add_argument('--products', type=int, default=3000, help='product ids to pick from (seed.py scale)')
+    parser.add_argument('--users', type=int, default=1000, help='bench users/tokens to pick from (seed.py scale)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--write-baseline', help='save results as a new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    count_queries = query_counter()
+    results: Dict[str, Dict[str, Any]] = {}
+    print('%-10s %8s %7s %9s %9s %9s %9s %8s' % (
+        'scenario', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'q/req'))
+    for scenario in args.scenario or ['tests', 'catalog', 'checkout', 'dashboard', 'auth']:
+        r = run_scenario(scenario, args, count_queries)
+        results[scenario] = r
+        print('%-10s %8d %7d %9.1f %9.2f %9.2f %9.2f %8s' % (
+            scenario, r['requests'], r['errors'], r['throughput'], r['p50_ms'], r['p95_ms'], r['p99_ms'],
+            '-' if r['queries_per_request'] is None else r['queries_per_request']))
+
+    if args.write_baseline:
+        with open(args.write_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print('REGRESSION ' + line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
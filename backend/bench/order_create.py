@@ -0,0 +1,112 @@
+"""
+Бенчмарк создания заказа: построчные INSERT против одного запроса create_order.
+
+Каждый заказ создаётся в транзакции, которая откатывается, поэтому база не меняется.
+Корзины собираются из товаров в наличии. Если create_order всё же отказал (нехватка остатка,
+в API это 409), заказ считается отклонённым: в задержки он не входит и выводится отдельной колонкой.
+Запуск: DATABASE_URL=postgresql://... python backend/bench/order_create.py --sizes 1,5,20,50 --repeat 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'orders'))
+
+from index import create_order  # noqa: E402
+
+
+def create_order_row_by_row(cur, body_data: Dict[str, Any]) -> int:
+    cur.execute(
+        "INSERT INTO orders (customer_name, customer_phone, customer_email, customer_address, "
+        "total_amount, delivery_method, payment_method) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id",
+        (
+            body_data['customer_name'], body_data['customer_phone'],
+            body_data.get('customer_email', ''), body_data.get('customer_address', ''),
+            body_data['total_amount'], body_data.get('delivery_method', 'pickup'),
+            body_data.get('payment_method', 'cash')
+        )
+    )
+    order_id = cur.fetchone()[0]
+    for item in body_data.get('items', []):
+        cur.execute(
+            "INSERT INTO order_items (order_id, product_id, product_name, quantity, price) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            (order_id, item['product_id'], item['product_name'], item['quantity'], item['price'])
+        )
+    return order_id
+
+
+def make_cart(products: List[tuple], size: int) -> Dict[str, Any]:
+    items = [
+        {'product_id': p[0], 'product_name': p[1], 'quantity': 1, 'price': p[2]}
+        for p in (products[i % len(products)] for i in range(size))
+    ]
+    return {
+        'customer_name': 'Бенчмарк',
+        'customer_phone': '+70000000000',
+        'total_amount': sum(i['price'] for i in items),
+        'items': items
+    }
+
+
+def measure(conn, fn: Callable, body_data: Dict[str, Any], repeat: int) -> Tuple[List[float], int]:
+    """Задержки созданных заказов в мс и число отклонённых (create_order вернул id None)."""
+    timings = []
+    rejected = 0
+    cur = conn.cursor()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = fn(cur, body_data)
+            elapsed = (time.perf_counter() - started) * 1000
+            conn.rollback()
+            if isinstance(result, tuple) and result[0] is None:
+                rejected += 1
+            else:
+                timings.append(elapsed)
+    finally:
+        cur.close()
+    return timings, rejected
+
+
+def summarize(timings: List[float]) -> str:
+    if not timings:
+        return '%10s / %-9s' % ('-', '-')
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return '%10.2f / %-9.2f' % (statistics.median(timings), p95)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='1,5,20,50')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id, name, price FROM products WHERE stock > 0 ORDER BY id")
+        products = cur.fetchall()
+        cur.close()
+        if not products:
+            sys.exit('no products in stock')
+
+        print('%6s  %22s  %22s  %8s' % ('items', 'row-by-row p50/p95 ms', 'single query p50/p95 ms', 'rejected'))
+        for size in (int(s) for s in args.sizes.split(',')):
+            body_data = make_cart(products, size)
+            row_by_row, _ = measure(conn, create_order_row_by_row, body_data, args.repeat)
+            single, rejected = measure(conn, create_order, body_data, args.repeat)
+            print('%6d  %22s  %22s  %8d' % (size, summarize(row_by_row), summarize(single), rejected))
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
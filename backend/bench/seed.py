@@ -0,0 +1,143 @@
+"""
+Синтетические данные для нагрузочных тестов в локальной базе.
+
+Все строки генерируются на стороне Postgres через generate_series, масштаб задаётся --scale:
+на единицу масштаба 3000 товаров, 1000 покупателей с сессиями (токены bench-token-<n>),
+администратор с сессией bench-admin-token (для админских запросов из tests.json),
+10000 заказов за последний год и 50 постов блога. После вставки пересчитываются сводки
+analytics_daily, статистика товаров и счётчики заказов клиентов. Ожидается база с применёнными db_migrations.
+
+Запуск: DATABASE_URL=postgresql://localhost/nursery_bench python backend/bench/seed.py --scale 1 --truncate
+"""
+import argparse
+import os
+import sys
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dev_server import load_function  # noqa: E402
+
+CATEGORIES = ['peonies', 'clematis', 'shrubs', 'seeds', 'fertilizers', 'other']
+
+TRUNCATE_SQL = """
+    TRUNCATE order_items, orders, sessions, referrals, customers, users, products, blog_posts,
+             analytics_daily, product_sales_summary, product_sales_daily
+    RESTART IDENTITY CASCADE
+"""
+
+SEED_STEPS = [
+    ('products', """
+        INSERT INTO products (name, category, price, description, image_url, badge, stock, created_at, updated_at)
+        SELECT 'Сорт ' || n || ' ' || (ARRAY['Пион', 'Клематис', 'Гортензия', 'Семена', 'Удобрение', 'Княжик'])[1 + n %% 6],
+               (%(categories)s::text[])[1 + n %% 6],
+               200 + (n * 37) %% 2800,
+               repeat('Морозоустойчивый сорт с крупными цветами, цветёт в июне. ', 1 + n %% 4),
+               '/placeholder.svg',
+               CASE WHEN n %% 10 = 0 THEN 'Хит' END,
+               1000000,
+               now() - (n %% 365) * interval '1 day',
+               now() - (n %% 365) * interval '1 day'
+        FROM generate_series(1, %(products)s) AS n
+    """),
+    ('users', """
+        INSERT INTO users (email, password_hash, full_name, phone, role, referral_code, created_at)
+        SELECT 'bench-' || n || '@example.com', md5('bench' || n), 'Покупатель ' || n,
+               '+7900' || lpad(n::text, 7, '0'), 'customer', 'BENCH' || n,
+               now() - (n %% 365) * interval '1 day'
+        FROM generate_series(1, %(users)s) AS n
+    """),
+    ('customers', """
+        INSERT INTO customers (user_id, discount_percent, status, created_at)
+        SELECT id, CASE WHEN id %% 10 = 0 THEN 10 ELSE 0 END, 'active', created_at FROM users
+        WHERE email LIKE 'bench-%%'
+    """),
+    ('sessions', """
+        INSERT INTO sessions (user_id, token, expires_at)
+        SELECT id, 'bench-token-' || id, now() + interval '30 days' FROM users
+        WHERE email LIKE 'bench-%%'
+    """),
+    ('admin', """
+        WITH admin AS (
+            INSERT INTO users (email, password_hash, full_name, role, referral_code)
+            VALUES ('admin-bench@example.com', md5('admin-bench'), 'Администратор', 'admin', 'BENCHADMIN')
+            RETURNING id
+        )
+        INSERT INTO sessions (user_id, token, expires_at)
+        SELECT id, 'bench-admin-token', now() + interval '30 days' FROM admin
+    """),
+    ('orders', """
+        INSERT INTO orders (customer_name, customer_phone, customer_email, total_amount, status,
+                            delivery_method, payment_method, user_id, created_at, updated_at)
+        SELECT 'Покупатель ' || u, '+7900' || lpad(u::text, 7, '0'), 'bench-' || u || '@example.com',
+               0, 'pending', 'pickup', 'cash', u,
+               now() - (n %% 365) * interval '1 day' - (n %% 1440) * interval '1 minute',
+               now() - (n %% 365) * interval '1 day'
+        FROM generate_series(1, %(orders)s) AS n,
+             LATERAL (SELECT %(first_user)s + (n * 7919) %% %(users)s AS u) pick
+    """),
+    ('order_items', """
+        INSERT INTO order_items (order_id, product_id, product_name, quantity, price, created_at)
+        SELECT o.id, p.id, p.name, 1 + (o.id + k) %% 3, p.price, o.created_at
+        FROM orders o
+        CROSS JOIN LATERAL generate_series(1, 1 + o.id %% 5) AS k
+        JOIN products p ON p.id = %(first_product)s + (o.id * 31 + k * 17) %% %(products)s
+        WHERE o.customer_email LIKE 'bench-%%'
+    """),
+    ('order totals', """
+        UPDATE orders o SET total_amount = t.total
+        FROM (SELECT order_id, SUM(quantity * price) AS total FROM order_items GROUP BY order_id) t
+        WHERE t.order_id = o.id AND o.customer_email LIKE 'bench-%%'
+    """),
+    ('blog_posts', """
+        INSERT INTO blog_posts (title, content, excerpt, image_url, published, created_at)
+        SELECT 'Статья ' || n, repeat(E'**Раздел**\\nПионы любят солнечные места.\\n- полив\\n- подкормка\\n', 20),
+               'Анонс статьи ' || n, '/placeholder.svg', true, now() - n * interval '1 day'
+        FROM generate_series(1, %(posts)s) AS n
+    """),
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--truncate', action='store_true', help='empty all tables before seeding')
+    args = parser.parse_args()
+
+    sizes = {
+        'categories': CATEGORIES,
+        'products': max(1, int(3000 * args.scale)),
+        'users': max(1, int(1000 * args.scale)),
+        'orders': max(1, int(10000 * args.scale)),
+        'posts': 50
+    }
+
+    admin = load_function('admin')
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    try:
+        if args.truncate:
+            cur.execute(TRUNCATE_SQL)
+        for name, sql in SEED_STEPS:
+            cur.execute(sql, sizes)
+            print('%-12s %8d rows' % (name, cur.rowcount))
+            if name == 'products':
+                cur.execute("SELECT MIN(id) FROM products WHERE name LIKE 'Сорт %'")
+                sizes['first_product'] = cur.fetchone()[0]
+            elif name == 'users':
+                cur.execute("SELECT MIN(id) FROM users WHERE email LIKE 'bench-%'")
+                sizes['first_user'] = cur.fetchone()[0]
+        admin.rebuild_analytics(cur)
+        admin.rebuild_product_stats(cur)
+        conn.commit()
+        admin.rebuild_customer_stats(conn, cur, 5000, sizes['users'])
+        cur.execute("ANALYZE")
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Нагрузочный тест резервирования остатков: много параллельных заказов на один товар.
+
+Создаёт временный товар с остатком --stock, запускает --workers потоков, каждый со своим
+соединением оформляет заказы по --quantity шт., пока товар не закончится. Проверяет, что
+продано ровно столько, сколько было на складе, и печатает пропускную способность.
+Все созданные строки удаляются в конце, а дневная сводка analytics_daily за вчера и сегодня
+пересчитывается заново, чтобы в ней не остались тестовые заказы.
+Запуск: DATABASE_URL=postgresql://... python backend/bench/stock_reservation.py --stock 500 --workers 50
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from typing import Dict, List
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dev_server import load_function  # noqa: E402
+
+orders = load_function('orders')
+admin = load_function('admin')
+
+
+def worker(dsn: str, product_id: int, quantity: int, attempts: int,
+           stats: Dict[str, int], order_ids: List[int], lock: threading.Lock) -> None:
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    body_data = {
+        'customer_name': 'Нагрузочный тест',
+        'customer_phone': '+70000000000',
+        'items': [{'product_id': product_id, 'product_name': 'stock-test', 'quantity': quantity, 'price': 1}]
+    }
+    try:
+        for _ in range(attempts):
+            order_id, _shortages = orders.create_order(cur, body_data)
+            if order_id is None:
+                conn.rollback()
+                with lock:
+                    stats['rejected'] += 1
+                break
+            conn.commit()
+            with lock:
+                stats['accepted'] += 1
+                order_ids.append(order_id)
+    finally:
+        cur.close()
+        conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--stock', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=50)
+    parser.add_argument('--quantity', type=int, default=1)
+    args = parser.parse_args()
+
+    dsn = os.environ['DATABASE_URL']
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO products (name, category, price, stock) VALUES ('stock-test', 'other', 1, %s) RETURNING id",
+        (args.stock,)
+    )
+    product_id = cur.fetchone()[0]
+    conn.commit()
+
+    stats = {'accepted': 0, 'rejected': 0}
+    order_ids: List[int] = []
+    lock = threading.Lock()
+    attempts = args.stock // args.quantity + 1
+    threads = [
+        threading.Thread(target=worker, args=(dsn, product_id, args.quantity, attempts, stats, order_ids, lock))
+        for _ in range(args.workers)
+    ]
+
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    try:
+        cur.execute("SELECT stock FROM products WHERE id = %s", (product_id,))
+        final_stock = cur.fetchone()[0]
+        cur.execute("SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE product_id = %s", (product_id,))
+        sold = cur.fetchone()[0]
+
+        print('workers=%d stock=%d quantity=%d' % (args.workers, args.stock, args.quantity))
+        print('accepted=%d rejected=%d sold=%d final_stock=%d' % (
+            stats['accepted'], stats['rejected'], sold, final_stock))
+        print('elapsed=%.2fs throughput=%.1f orders/s' % (elapsed, stats['accepted'] / elapsed if elapsed else 0))
+
+        oversold = sold > args.stock or final_stock < 0 or sold + final_stock != args.stock
+        print('OVERSOLD' if oversold else 'OK: no oversell')
+    finally:
+        conn.rollback()
+        cur.execute("DELETE FROM order_items WHERE product_id = %s", (product_id,))
+        cur.execute("DELETE FROM orders WHERE id = ANY(%s)", (order_ids,))
+        cur.execute("DELETE FROM product_sales_daily WHERE product_id = %s", (product_id,))
+        cur.execute("DELETE FROM product_sales_summary WHERE product_id = %s", (product_id,))
+        cur.execute("DELETE FROM products WHERE id = %s", (product_id,))
+        admin.rebuild_analytics(cur, days=1)
+        conn.commit()
+        cur.close()
+        conn.close()
+
+    if oversold:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""
+Пул соединений PostgreSQL, общий для всех вызовов тёплого экземпляра функции.
+
+Каждая облачная функция деплоится из своей папки, поэтому этот модуль лежит
+одинаковой копией в каждой backend/<функция>/db.py — правки вносятся во все копии.
+
+Настройки через переменные окружения:
+DATABASE_URL - строка подключения
+DB_POOL_MAX_SIZE - максимум одновременно открытых соединений (по умолчанию 4)
+DB_POOL_IDLE_TIMEOUT - через сколько секунд простоя соединение закрывается (300)
+DB_POOL_CHECK_INTERVAL - после скольких секунд простоя соединение проверяется SELECT 1 перед
+    выдачей (0 - при каждой выдаче). Разрыв сокета не зависит от времени простоя, поэтому по
+    умолчанию проверяется каждое соединение: это один сетевой обмен (обычно доли миллисекунды)
+    на вызов функции, зато запрос не падает на соединении, закрытом сервером или балансировщиком
+DB_POOL_WAIT_TIMEOUT - сколько ждать свободного соединения при исчерпании пула (10)
+DB_QUERY_BUDGET - сколько запросов к базе допустимо за один вызов функции (10)
+
+Все курсоры пула - InstrumentedCursor: пока идёт трассировка (start_trace/finish_trace,
+их вызывает response.http_handler), каждый execute записывается в QueryTrace текущего
+потока с длительностью и нормализованным текстом SQL.
+"""
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+
+QUERY_BUDGET = int(os.environ.get('DB_QUERY_BUDGET', '10'))
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE_RE = re.compile(r'\s+')
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def normalize_sql(query: Any) -> str:
+    """Схлопывает пробелы и заменяет литералы на ?, чтобы одинаковые запросы группировались."""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    elif not isinstance(query, str):
+        query = str(query)
+    return _SPACE_RE.sub(' ', _LITERAL_RE.sub('?', query)).strip()
+
+
+class QueryTrace:
+    def __init__(self):
+        self.queries: List[Tuple[str, float]] = []
+
+    def record(self, query: Any, duration_ms: float) -> None:
+        self.queries.append((normalize_sql(query), duration_ms))
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def total_ms(self) -> float:
+        return sum(ms for _, ms in self.queries)
+
+    @property
+    def over_budget(self) -> bool:
+        return self.count > QUERY_BUDGET
+
+    def slowest(self, limit: int = 3) -> List[Dict[str, Any]]:
+        ranked = sorted(self.queries, key=lambda q: q[1], reverse=True)[:limit]
+        return [{'sql': sql[:200], 'ms': round(ms, 2)} for sql, ms in ranked]
+
+    def repeated(self) -> Dict[str, int]:
+        """Запросы, выполненные больше одного раза, - типичный след N+1."""
+        counts = Counter(sql for sql, _ in self.queries)
+        return {sql[:200]: n for sql, n in counts.most_common() if n > 1}
+
+
+_trace_local = threading.local()
+
+
+def start_trace() -> QueryTrace:
+    _trace_local.trace = QueryTrace()
+    return _trace_local.trace
+
+
+def finish_trace() -> Optional[QueryTrace]:
+    trace = getattr(_trace_local, 'trace', None)
+    _trace_local.trace = None
+    return trace
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    def _record(self, query: Any, started: float) -> None:
+        trace = getattr(_trace_local, 'trace', None)
+        if trace is not None:
+            trace.record(query, (time.perf_counter() - started) * 1000)
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._record(query, started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._record(query, started)
+
+
+class ConnectionPool:
+    def __init__(self, dsn: str, max_size: int = 4, idle_timeout: float = 300.0,
+                 check_interval: float = 0.0, wait_timeout: float = 10.0):
+        self.dsn = dsn
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.wait_timeout = wait_timeout
+        self._idle: List[Tuple[psycopg2.extensions.connection, float]] = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+    def _connect(self) -> psycopg2.extensions.connection:
+        return psycopg2.connect(self.dsn, cursor_factory=InstrumentedCursor)
+
+    @staticmethod
+    def _close(conn: psycopg2.extensions.connection) -> None:
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    @staticmethod
+    def _is_alive(conn: psycopg2.extensions.connection) -> bool:
+        """
+        SELECT 1 в режиме autocommit - один сетевой обмен без BEGIN/ROLLBACK.
+        Обычный курсор, а не InstrumentedCursor: проверка не попадает в трассировку вызова.
+        """
+        if conn.closed:
+            return False
+        try:
+            conn.autocommit = True
+            try:
+                cur = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+                try:
+                    cur.execute("SELECT 1")
+                    cur.fetchone()
+                finally:
+                    cur.close()
+            finally:
+                conn.autocommit = False
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def getconn(self) -> psycopg2.extensions.connection:
+        """
+        Выдаёт живое соединение: из простаивающих или новое, если есть место.
+        Простаивавшее соединение проверяется (см. DB_POOL_CHECK_INTERVAL) и при разрыве
+        заменяется новым.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            while not self._idle and self._in_use >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout('No free database connections')
+                self._cond.wait(remaining)
+            candidate = self._idle.pop() if self._idle else None
+            self._in_use += 1
+
+        try:
+            if candidate is not None:
+                conn, released_at = candidate
+                idle_for = time.monotonic() - released_at
+                if idle_for > self.idle_timeout:
+                    self._close(conn)
+                elif idle_for < self.check_interval and not conn.closed:
+                    return conn
+                elif self._is_alive(conn):
+                    return conn
+                else:
+                    self._close(conn)
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn: psycopg2.extensions.connection) -> None:
+        """Возвращает соединение; незавершённая транзакция откатывается, битое соединение закрывается."""
+        reusable = not conn.closed
+        if reusable and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                reusable = False
+        if not reusable:
+            self._close(conn)
+
+        with self._cond:
+            self._in_use -= 1
+            if reusable:
+                self._idle.append((conn, time.monotonic()))
+            self._prune_idle()
+            self._cond.notify()
+
+    def _prune_idle(self) -> None:
+        now = time.monotonic()
+        keep = []
+        for conn, released_at in self._idle:
+            if now - released_at > self.idle_timeout or len(keep) + self._in_use >= self.max_size:
+                self._close(conn)
+            else:
+                keep.append((conn, released_at))
+        self._idle = keep
+
+    def closeall(self) -> None:
+        with self._cond:
+            for conn, _ in self._idle:
+                self._close(conn)
+            self._idle = []
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    os.environ.get('DATABASE_URL', ''),
+                    max_size=int(os.environ.get('DB_POOL_MAX_SIZE', '4')),
+                    idle_timeout=float(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300')),
+                    check_interval=float(os.environ.get('DB_POOL_CHECK_INTERVAL', '0')),
+                    wait_timeout=float(os.environ.get('DB_POOL_WAIT_TIMEOUT', '10')),
+                )
+    return _pool
+
+
+def acquire() -> psycopg2.extensions.connection:
+    return get_pool().getconn()
+
+
+def release(conn: psycopg2.extensions.connection) -> None:
+    get_pool().putconn(conn)
@@ -1,33 +1,106 @@
 import json
+import html
 import os
-import psycopg2
-from typing import Dict, Any
+import re
+import time
+from typing import Dict, Any, List, Tuple
 
+import db
+from response import (
+    http_handler, json_response, error_response, body_response, options_response, dumps,
+    make_etag, etag_matches
+)
+
+BLOG_VERSION_TTL = float(os.environ.get('BLOG_VERSION_TTL', '30'))
+BLOG_CACHE_MAX_ENTRIES = 256
+BLOG_CACHE_CONTROL = 'public, max-age=300'
+EXCERPT_LENGTH = 200
+WORDS_PER_MINUTE = 180
+
+_blog_cache: Dict[str, Any] = {'version': None, 'checked_at': 0.0, 'bodies': {}}
+
+RENDER_POSTS_SQL = """
+    UPDATE blog_posts b
+    SET content_html = r.content_html, excerpt = r.excerpt, reading_time = r.reading_time,
+        updated_at = clock_timestamp()
+    FROM jsonb_to_recordset(%s::jsonb) AS r(id INTEGER, content_html TEXT, excerpt TEXT, reading_time INTEGER)
+    WHERE b.id = r.id
+      AND (b.content_html, b.excerpt, b.reading_time) IS DISTINCT FROM (r.content_html, r.excerpt, r.reading_time)
+"""
+
+def render_content(content: str) -> str:
+    """
+    Переводит разметку постов в HTML по тем же правилам, что и страница поста:
+    строка **...** - h3, # - h2, строки "- " и "1." - li, остальные непустые - абзацы.
+    """
+    parts: List[str] = []
+    
+    for line in content.split('\n'):
+        if line.startswith('**') and line.endswith('**'):
+            parts.append('<h3 class="text-2xl font-bold mt-6 mb-4">%s</h3>' % html.escape(line.replace('**', '')))
+        elif line.startswith('# '):
+            parts.append('<h2 class="text-3xl font-bold mt-8 mb-4">%s</h2>' % html.escape(line[2:]))
+        elif line.startswith('- '):
+            parts.append('<li class="ml-6 mb-2">%s</li>' % html.escape(line[2:]))
+        elif re.match(r'^\d+\.', line):
+            parts.append('<li class="ml-6 mb-2">%s</li>' % html.escape(re.sub(r'^\d+\.\s', '', line)))
+        elif line.strip():
+            parts.append('<p class="mb-4 text-lg leading-relaxed">%s</p>' % html.escape(line))
+    
+    return ''.join(parts)
+
+def plain_text(content: str) -> str:
+    text = re.sub(r'^(#\s|-\s|\d+\.\s?)', '', content, flags=re.MULTILINE)
+    return ' '.join(text.replace('**', '').split())
+
+def make_excerpt(content: str) -> str:
+    text = plain_text(content)
+    if len(text) <= EXCERPT_LENGTH:
+        return text
+    return text[:EXCERPT_LENGTH].rsplit(' ', 1)[0].rstrip(',.:;—-') + '…'
+
+def reading_time(content: str) -> int:
+    return max(1, round(len(plain_text(content).split()) / WORDS_PER_MINUTE))
+
+def prepare_post(body_data: Dict[str, Any]) -> Tuple[str, str, int]:
+    """Считается при записи: HTML, анонс (если не задан) и время чтения в минутах."""
+    content = body_data['content']
+    return render_content(content), body_data.get('excerpt') or make_excerpt(content), reading_time(content)
+
+def check_blog_version(cur) -> None:
+    now = time.monotonic()
+    if _blog_cache['version'] is not None and now - _blog_cache['checked_at'] < BLOG_VERSION_TTL:
+        return
+    
+    cur.execute("SELECT COUNT(*), MAX(updated_at) FROM blog_posts")
+    count, last_updated = cur.fetchone()
+    version = (count, last_updated.isoformat() if last_updated else None)
+    if version != _blog_cache['version']:
+        _blog_cache['bodies'] = {}
+        _blog_cache['version'] = version
+    _blog_cache['checked_at'] = now
+
+def invalidate_blog() -> None:
+    _blog_cache['version'] = None
+    _blog_cache['bodies'] = {}
+
+@http_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     API для работы с блогом питомника
     GET / - получить все опубликованные посты
-    GET /?id=1 - получить конкретный пост
-    POST / - создать пост (админ)
+    GET /?id=1 - получить конкретный пост (с готовым content_html)
+    Ответы GET отдаются из кэша по версии блога с ETag и Cache-Control
+    POST / - создать пост (админ), HTML, анонс и время чтения считаются при записи
     PUT /?id=1 - обновить пост (админ)
+    POST /?action=render - пересчитать HTML, анонсы и время чтения всех постов
     """
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Key',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return options_response('GET, POST, PUT, OPTIONS', 'Content-Type, X-Admin-Key, If-None-Match')
     
-    dsn = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(dsn)
+    conn = db.acquire()
     cur = conn.cursor()
     
     try:
@@ -35,115 +108,123 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             params = event.get('queryStringParameters') or {}
             post_id = params.get('id')
             
-            if post_id:
+            check_blog_version(cur)
+            cache_key = 'post:%s' % post_id if post_id else 'list'
+            cached = _blog_cache['bodies'].get(cache_key)
+            
+            if cached is None and post_id:
                 cur.execute(
-                    "SELECT id, title, content, excerpt, image_url, author, published, created_at "
+                    "SELECT id, title, content, excerpt, image_url, author, published, created_at, "
+                    "content_html, reading_time "
                     "FROM blog_posts WHERE id = %s AND published = true",
                     (post_id,)
                 )
                 row = cur.fetchone()
                 if not row:
-                    return {
-                        'statusCode': 404,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Post not found'}),
-                        'isBase64Encoded': False
-                    }
+                    return error_response(404, 'Post not found')
                 
                 post = {
                     'id': row[0], 'title': row[1], 'content': row[2], 'excerpt': row[3],
                     'image_url': row[4], 'author': row[5], 'published': row[6],
-                    'created_at': row[7].isoformat() if row[7] else None
-                }
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps(post, ensure_ascii=False),
-                    'isBase64Encoded': False
+                    'created_at': row[7].isoformat() if row[7] else None,
+                    'content_html': row[8] if row[8] is not None else render_content(row[2]),
+                    'reading_time': row[9] if row[9] is not None else reading_time(row[2])
                 }
+                body = dumps(post)
+                cached = (body, make_etag(body))
             
-            cur.execute(
-                "SELECT id, title, excerpt, image_url, author, created_at "
-                "FROM blog_posts WHERE published = true ORDER BY created_at DESC"
-            )
+            elif cached is None:
+                cur.execute(
+                    "SELECT id, title, excerpt, image_url, author, created_at, reading_time, "
+                    "CASE WHEN reading_time IS NULL THEN content END "
+                    "FROM blog_posts WHERE published = true ORDER BY created_at DESC"
+                )
+                
+                posts = []
+                for row in cur.fetchall():
+                    posts.append({
+                        'id': row[0], 'title': row[1], 'excerpt': row[2],
+                        'image_url': row[3], 'author': row[4],
+                        'created_at': row[5].isoformat() if row[5] else None,
+                        'reading_time': row[6] if row[6] is not None else reading_time(row[7])
+                    })
+                body = dumps(posts)
+                cached = (body, make_etag(body))
+            
+            if len(_blog_cache['bodies']) < BLOG_CACHE_MAX_ENTRIES:
+                _blog_cache['bodies'][cache_key] = cached
             
-            posts = []
-            for row in cur.fetchall():
-                posts.append({
-                    'id': row[0], 'title': row[1], 'excerpt': row[2],
-                    'image_url': row[3], 'author': row[4],
-                    'created_at': row[5].isoformat() if row[5] else None
-                })
+            body, etag = cached
+            cache_headers = {'ETag': etag, 'Cache-Control': BLOG_CACHE_CONTROL}
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(posts, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            if etag_matches(event.get('headers') or {}, etag):
+                return body_response(304, '', cache_headers)
+            
+            return body_response(200, body, cache_headers)
+        
+        elif method == 'POST' and (event.get('queryStringParameters') or {}).get('action') == 'render':
+            cur.execute("SELECT id, content, excerpt FROM blog_posts")
+            rendered = []
+            for post_id, content, excerpt in cur.fetchall():
+                content_html, excerpt, minutes = prepare_post({'content': content, 'excerpt': excerpt})
+                rendered.append({'id': post_id, 'content_html': content_html, 'excerpt': excerpt, 'reading_time': minutes})
+            cur.execute(RENDER_POSTS_SQL, (json.dumps(rendered),))
+            changed = cur.rowcount
+            conn.commit()
+            invalidate_blog()
+            
+            return json_response(200, {'message': 'Posts rendered', 'posts': len(rendered), 'changed': changed})
         
         elif method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
             
+            content_html, excerpt, minutes = prepare_post(body_data)
+            
             cur.execute(
-                "INSERT INTO blog_posts (title, content, excerpt, image_url, author, published) "
-                "VALUES (%s, %s, %s, %s, %s, %s) RETURNING id",
+                "INSERT INTO blog_posts (title, content, excerpt, image_url, author, published, "
+                "content_html, reading_time) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id",
                 (
-                    body_data['title'], body_data['content'], body_data.get('excerpt', ''),
+                    body_data['title'], body_data['content'], excerpt,
                     body_data.get('image_url', '/placeholder.svg'),
-                    body_data.get('author', 'Бал цветов'), body_data.get('published', False)
+                    body_data.get('author', 'Бал цветов'), body_data.get('published', False),
+                    content_html, minutes
                 )
             )
             new_id = cur.fetchone()[0]
             conn.commit()
+            invalidate_blog()
             
-            return {
-                'statusCode': 201,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'id': new_id, 'message': 'Post created'}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(201, {'id': new_id, 'message': 'Post created'})
         
         elif method == 'PUT':
             params = event.get('queryStringParameters') or {}
             post_id = params.get('id')
             if not post_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Post ID required'}),
-                    'isBase64Encoded': False
-                }
+                return error_response(400, 'Post ID required')
             
             body_data = json.loads(event.get('body', '{}'))
+            content_html, excerpt, minutes = prepare_post(body_data)
             
             cur.execute(
                 "UPDATE blog_posts SET title=%s, content=%s, excerpt=%s, image_url=%s, "
-                "author=%s, published=%s, updated_at=CURRENT_TIMESTAMP WHERE id=%s",
+                "author=%s, published=%s, content_html=%s, reading_time=%s, "
+                "updated_at=clock_timestamp() WHERE id=%s",
                 (
-                    body_data['title'], body_data['content'], body_data.get('excerpt', ''),
+                    body_data['title'], body_data['content'], excerpt,
                     body_data.get('image_url', '/placeholder.svg'),
                     body_data.get('author', 'Бал цветов'), body_data.get('published', False),
-                    post_id
+                    content_html, minutes, post_id
                 )
             )
             conn.commit()
+            invalidate_blog()
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'message': 'Post updated'}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(200, {'message': 'Post updated'})
         
         else:
-            return {
-                'statusCode': 405,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Method not allowed'}),
-                'isBase64Encoded': False
-            }
+            return error_response(405, 'Method not allowed')
     
     finally:
         cur.close()
-        conn.close()
+        db.release(conn)
@@ -0,0 +1,181 @@
+"""
+Локальный сервер для всех облачных функций из func2url.json.
+
+Каждая функция backend/<имя>/index.py монтируется по пути /<имя> и по id из её
+облачного URL, так что во фронтенде достаточно заменить https://functions.poehali.dev
+на http://localhost:8000. HTTP-запрос переводится в событие облачной функции
+(httpMethod, headers, queryStringParameters, body, isBase64Encoded) и обратно.
+
+Запуск: DATABASE_URL=postgresql://... python backend/dev_server.py --port 8000 --workers 4
+"""
+import argparse
+import base64
+import importlib
+import json
+import os
+import signal
+import sys
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+from types import ModuleType, SimpleNamespace
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TEXT_CONTENT_TYPES = ('text/', 'application/json', 'application/x-www-form-urlencoded', 'application/xml')
+
+
+def load_function(name: str) -> ModuleType:
+    """
+    Импортирует backend/<name>/index.py вместе с его локальными модулями (db.py, response.py).
+    У всех функций модули называются одинаково, поэтому после импорта они убираются
+    из sys.modules — каждый index держит ссылки на свои копии.
+    """
+    function_dir = os.path.join(BACKEND_DIR, name)
+    local_modules = {f[:-3] for f in os.listdir(function_dir) if f.endswith('.py')}
+    for module_name in local_modules:
+        sys.modules.pop(module_name, None)
+
+    sys.path.insert(0, function_dir)
+    try:
+        module = importlib.import_module('index')
+    finally:
+        sys.path.remove(function_dir)
+        for module_name in local_modules:
+            sys.modules.pop(module_name, None)
+    return module
+
+
+def load_routes() -> Dict[str, Tuple[str, Callable]]:
+    with open(os.path.join(BACKEND_DIR, 'func2url.json')) as f:
+        func2url = json.load(f)
+
+    routes: Dict[str, Tuple[str, Callable]] = {}
+    for name, url in func2url.items():
+        handler = load_function(name).handler
+        routes['/' + name] = (name, handler)
+        function_id = urlsplit(url).path.strip('/')
+        if function_id:
+            routes['/' + function_id] = (name, handler)
+    return routes
+
+
+def build_event(method: str, path: str, query: str, headers: Dict[str, str], body: bytes) -> Dict[str, Any]:
+    content_type = headers.get('content-type', '')
+    is_text = not body or content_type.startswith(TEXT_CONTENT_TYPES)
+    return {
+        'httpMethod': method,
+        'path': path,
+        'headers': headers,
+        'queryStringParameters': dict(parse_qsl(query, keep_blank_values=True)),
+        'body': body.decode('utf-8') if is_text else base64.b64encode(body).decode('ascii'),
+        'isBase64Encoded': not is_text,
+        'requestContext': {
+            'requestId': uuid.uuid4().hex,
+            'identity': {'sourceIp': headers.get('x-forwarded-for', '127.0.0.1')}
+        }
+    }
+
+
+def make_request_handler(routes: Dict[str, Tuple[str, Callable]]) -> type:
+    class FunctionRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def handle_any(self) -> None:
+            parts = urlsplit(self.path)
+            route = routes.get(parts.path.rstrip('/') or '/')
+            if route is None:
+                self.send_plain(404, 'No function mounted at %s' % parts.path)
+                return
+
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            headers = {k.lower(): v for k, v in self.headers.items()}
+            event = build_event(self.command, parts.path, parts.query, headers, body)
+
+            name, handler = route
+            context = SimpleNamespace(
+                request_id=event['requestContext']['requestId'],
+                function_name=name,
+                memory_limit_in_mb=128
+            )
+            try:
+                result = handler(event, context)
+            except Exception as e:
+                self.log_error('%s raised %r', name, e)
+                self.send_plain(502, 'Function %s failed: %r' % (name, e))
+                return
+
+            payload = result.get('body') or ''
+            if result.get('isBase64Encoded'):
+                payload = base64.b64decode(payload)
+            elif isinstance(payload, str):
+                payload = payload.encode('utf-8')
+
+            self.send_response(result.get('statusCode', 200))
+            for key, value in (result.get('headers') or {}).items():
+                self.send_header(key, str(value))
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(payload)
+
+        def send_plain(self, status: int, message: str) -> None:
+            payload = message.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_OPTIONS = do_HEAD = handle_any
+
+    return FunctionRequestHandler
+
+
+def serve(host: str, port: int, workers: int, threaded: bool) -> None:
+    routes = load_routes()
+    server_class = ThreadingHTTPServer if threaded else HTTPServer
+    server = server_class((host, port), make_request_handler(routes))
+
+    for path, (name, _) in sorted(routes.items()):
+        print('%-45s -> backend/%s/index.py' % (path, name))
+    print('Listening on http://%s:%d with %d worker(s)' % (host, port, workers))
+
+    if workers <= 1:
+        server.serve_forever()
+        return
+
+    children: List[int] = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            server.serve_forever()
+            os._exit(0)
+        children.append(pid)
+
+    try:
+        while children:
+            pid, _ = os.wait()
+            children.remove(pid)
+    except KeyboardInterrupt:
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+        time.sleep(0.2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=1, help='number of forked worker processes')
+    parser.add_argument('--no-threads', action='store_true', help='serve one request at a time per worker')
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, not args.no_threads)
+
+
+if __name__ == '__main__':
+    main()
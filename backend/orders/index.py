@@ -1,138 +1,472 @@
 import json
-import os
-import psycopg2
-from typing import Dict, Any
+from datetime import date, datetime
+from typing import Dict, Any, List, Optional, Tuple
 
+import db
+import pricing
+from response import (
+    http_handler, json_response, error_response, options_response,
+    get_auth_token, require_admin, parse_limit, encode_cursor, decode_cursor
+)
+
+ORDER_FIELDS = ['id', 'customer_name', 'customer_phone', 'customer_email', 'customer_address',
+                'total_amount', 'status', 'delivery_method', 'payment_method', 'user_id', 'created_at']
+ORDER_LIST_PARAMS = ('status', 'date_from', 'date_to', 'delivery_method', 'payment_method', 'limit', 'cursor', 'include')
+ORDERS_DEFAULT_LIMIT = 50
+ORDERS_MAX_LIMIT = 200
+ORDERS_MAX_IDS = 100
+
+ORDER_STATUS_TRANSITIONS = {
+    'pending': ('confirmed', 'cancelled'),
+    'confirmed': ('packed', 'cancelled'),
+    'packed': ('shipped', 'cancelled'),
+    'shipped': ('delivered',),
+    'delivered': (),
+    'cancelled': ()
+}
+STATUS_MAX_IDS = 500
+
+CHANGE_STATUS_SQL = """
+    WITH requested AS (
+        SELECT DISTINCT unnest(%(ids)s::INTEGER[]) AS id
+    ), locked AS (
+        SELECT id, status, user_id, total_amount FROM orders
+        WHERE id IN (SELECT id FROM requested)
+        ORDER BY id
+        FOR UPDATE
+    ), moved AS (
+        UPDATE orders o
+        SET status = %(status)s, updated_at = CURRENT_TIMESTAMP
+        FROM locked l
+        WHERE o.id = l.id AND l.status = ANY(%(from_statuses)s)
+        RETURNING o.id, o.user_id, o.total_amount
+    ), released AS (
+        SELECT oi.product_id, SUM(oi.quantity)::INTEGER AS quantity
+        FROM order_items oi
+        JOIN moved m ON m.id = oi.order_id
+        WHERE %(status)s = 'cancelled' AND oi.product_id IS NOT NULL
+        GROUP BY oi.product_id
+    ), locked_products AS (
+        SELECT id FROM products
+        WHERE id IN (SELECT product_id FROM released)
+        ORDER BY id
+        FOR UPDATE
+    ), restock AS (
+        UPDATE products p
+        SET stock = p.stock + r.quantity, updated_at = clock_timestamp()
+        FROM released r
+        JOIN locked_products lp ON lp.id = r.product_id
+        WHERE p.id = r.product_id
+    ), customer_totals AS (
+        UPDATE customers c SET
+            total_orders = GREATEST(COALESCE(c.total_orders, 0) - x.orders, 0),
+            total_spent = GREATEST(COALESCE(c.total_spent, 0) - x.spent, 0),
+            last_order_date = (
+                SELECT MAX(o.created_at) FROM orders o
+                WHERE o.user_id = c.user_id AND o.status IS DISTINCT FROM 'cancelled'
+                  AND o.id NOT IN (SELECT id FROM moved)
+            ),
+            updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT user_id, COUNT(*) AS orders, SUM(total_amount) AS spent
+            FROM moved
+            WHERE %(status)s = 'cancelled' AND user_id IS NOT NULL
+            GROUP BY user_id
+        ) x
+        WHERE c.user_id = x.user_id
+    )
+    SELECT r.id, l.status, m.id IS NOT NULL
+    FROM requested r
+    LEFT JOIN locked l ON l.id = r.id
+    LEFT JOIN moved m ON m.id = r.id
+    ORDER BY r.id
+"""
+
+CREATE_ORDER_SQL = """
+    WITH buyer AS (
+        SELECT user_id FROM sessions
+        WHERE token = %(token)s AND expires_at > CURRENT_TIMESTAMP
+    ), requested AS (
+        SELECT i.product_id, MIN(i.product_name) AS product_name, MIN(i.price) AS price,
+               SUM(i.quantity)::INTEGER AS quantity
+        FROM jsonb_to_recordset(%(items)s::jsonb)
+            AS i(product_id INTEGER, product_name VARCHAR(255), quantity INTEGER, price INTEGER)
+        GROUP BY i.product_id
+    ), locked AS (
+        SELECT id, stock FROM products
+        WHERE id IN (SELECT product_id FROM requested)
+        ORDER BY id
+        FOR UPDATE
+    ), allocation AS (
+        SELECT r.product_id, r.product_name, r.price, r.quantity AS requested,
+               LEAST(r.quantity, GREATEST(COALESCE(l.stock, 0), 0)) AS reserved
+        FROM requested r
+        LEFT JOIN locked l ON l.id = r.product_id
+    ), accepted AS (
+        SELECT * FROM allocation
+        WHERE reserved > 0
+          AND (%(allow_partial)s OR NOT EXISTS (SELECT 1 FROM allocation WHERE reserved < requested))
+    ), reserve AS (
+        UPDATE products p
+        SET stock = p.stock - a.reserved, updated_at = clock_timestamp()
+        FROM accepted a
+        WHERE p.id = a.product_id
+        RETURNING p.id
+    ), new_order AS (
+        INSERT INTO orders (customer_name, customer_phone, customer_email, customer_address,
+                            total_amount, delivery_method, payment_method, user_id)
+        SELECT %(customer_name)s, %(customer_phone)s, %(customer_email)s, %(customer_address)s,
+               SUM(price * reserved), %(delivery_method)s, %(payment_method)s, (SELECT user_id FROM buyer)
+        FROM accepted
+        HAVING COUNT(*) > 0
+        RETURNING id, total_amount, created_at, user_id
+    ), new_items AS (
+        INSERT INTO order_items (order_id, product_id, product_name, quantity, price)
+        SELECT new_order.id, a.product_id, a.product_name, a.reserved, a.price
+        FROM new_order, accepted a
+    ), customer_totals AS (
+        UPDATE customers c SET
+            total_orders = COALESCE(c.total_orders, 0) + 1,
+            total_spent = COALESCE(c.total_spent, 0) + o.total_amount,
+            last_order_date = GREATEST(c.last_order_date, o.created_at),
+            updated_at = CURRENT_TIMESTAMP
+        FROM new_order o
+        WHERE c.user_id = o.user_id
+    ), daily AS (
+        INSERT INTO analytics_daily (date, total_orders, total_revenue, avg_order_value)
+        SELECT DATE(created_at), 1, total_amount, total_amount FROM new_order
+        ON CONFLICT (date) DO UPDATE SET
+            total_orders = analytics_daily.total_orders + 1,
+            total_revenue = analytics_daily.total_revenue + EXCLUDED.total_revenue,
+            avg_order_value = (analytics_daily.total_revenue + EXCLUDED.total_revenue)
+                              / (analytics_daily.total_orders + 1)
+    ), product_totals AS (
+        INSERT INTO product_sales_summary (product_id, times_ordered, total_quantity, total_revenue, last_sold_at)
+        SELECT a.product_id, 1, a.reserved, a.reserved * a.price, new_order.created_at
+        FROM new_order, accepted a
+        ON CONFLICT (product_id) DO UPDATE SET
+            times_ordered = product_sales_summary.times_ordered + 1,
+            total_quantity = product_sales_summary.total_quantity + EXCLUDED.total_quantity,
+            total_revenue = product_sales_summary.total_revenue + EXCLUDED.total_revenue,
+            last_sold_at = GREATEST(product_sales_summary.last_sold_at, EXCLUDED.last_sold_at)
+    ), product_daily AS (
+        INSERT INTO product_sales_daily (product_id, date, times_ordered, quantity, revenue)
+        SELECT a.product_id, DATE(new_order.created_at), 1, a.reserved, a.reserved * a.price
+        FROM new_order, accepted a
+        ON CONFLICT (product_id, date) DO UPDATE SET
+            times_ordered = product_sales_daily.times_ordered + 1,
+            quantity = product_sales_daily.quantity + EXCLUDED.quantity,
+            revenue = product_sales_daily.revenue + EXCLUDED.revenue
+    )
+    SELECT (SELECT id FROM new_order),
+           COALESCE(
+               (SELECT jsonb_agg(jsonb_build_object(
+                           'product_id', product_id, 'product_name', product_name,
+                           'requested', requested, 'available', reserved))
+                FROM allocation WHERE reserved < requested),
+               '[]'::jsonb
+           )
+"""
+
+QUOTE_SQL = """
+    WITH customer AS (""" + pricing.CUSTOMER_BY_TOKEN_SQL + """)
+    SELECT p.id, p.name, p.price, p.stock,
+           """ + pricing.effective_price_sql('COALESCE(cu.discount_percent, 0)') + """,
+           COALESCE(cu.discount_percent, 0)
+    FROM products p
+    LEFT JOIN customer cu ON true
+    """ + pricing.customer_prices_join('cu.id') + """
+    WHERE p.id = ANY(%(ids)s)
+"""
+
+def cart_quantities(items: Any) -> Dict[int, int]:
+    """
+    Проверяет позиции корзины: product_id - целое, quantity - целое > 0.
+    Возвращает {product_id: суммарное количество}; при ошибке ValueError с номером позиции.
+    """
+    if not isinstance(items, list):
+        raise ValueError('items must be a list')
+    quantities: Dict[int, int] = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError('items[%d]: must be an object' % index)
+        product_id = item.get('product_id')
+        quantity = item.get('quantity')
+        if not isinstance(product_id, int) or isinstance(product_id, bool):
+            raise ValueError('items[%d]: product_id must be an integer' % index)
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+            raise ValueError('items[%d]: quantity must be a positive integer' % index)
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+def quote_cart(cur, items: List[Dict[str, Any]], token: Optional[str]) -> Dict[str, Any]:
+    """
+    Считает корзину по текущим ценам одним запросом WHERE id = ANY(...).
+    Клиент определяется по токену сессии, цена - эффективная для него (см. pricing.py).
+    Цены и названия от клиента игнорируются. Некорректные позиции - ValueError (см. cart_quantities).
+    """
+    quantities = cart_quantities(items)
+    
+    cur.execute(QUOTE_SQL, {'token': token, 'ids': list(quantities)})
+    rows = {row[0]: row for row in cur.fetchall()}
+    
+    discount_percent = 0
+    lines = []
+    for product_id, quantity in quantities.items():
+        row = rows.get(product_id)
+        if row is None:
+            continue
+        unit_price = row[4]
+        discount_percent = row[5]
+        lines.append({
+            'product_id': product_id, 'product_name': row[1], 'quantity': quantity,
+            'base_price': row[2], 'price': unit_price, 'line_total': unit_price * quantity,
+            'in_stock': (row[3] or 0) >= quantity
+        })
+    
+    return {
+        'items': lines,
+        'missing': [product_id for product_id in quantities if product_id not in rows],
+        'discount_percent': discount_percent,
+        'total_amount': sum(line['line_total'] for line in lines)
+    }
+
+def create_order(cur, body_data: Dict[str, Any], token: Optional[str] = None) -> Tuple[Optional[int], List[Dict[str, Any]]]:
+    """
+    Создаёт заказ одним запросом: резервирует остатки (stock >= quantity), пишет заказ и позиции,
+    привязывает его к пользователю по токену сессии и добавляет в счётчики клиента (customers)
+    и в сводки analytics_daily, product_sales_summary и product_sales_daily.
+    Позиции должны быть уже посчитаны quote_cart — цены в них серверные.
+    Возвращает (id заказа, нехватки). Без allow_partial при любой нехватке заказ не создаётся
+    и id = None — вызывающий должен откатить транзакцию. С allow_partial короткие позиции
+    уменьшаются до доступного остатка. Блокируются только строки товаров из корзины.
+    """
+    items = [
+        {
+            'product_id': item['product_id'], 'product_name': item['product_name'],
+            'quantity': item['quantity'], 'price': item['price']
+        }
+        for item in body_data.get('items', [])
+    ]
+    cur.execute(CREATE_ORDER_SQL, {
+        'customer_name': body_data['customer_name'],
+        'customer_phone': body_data['customer_phone'],
+        'customer_email': body_data.get('customer_email', ''),
+        'customer_address': body_data.get('customer_address', ''),
+        'delivery_method': body_data.get('delivery_method', 'pickup'),
+        'payment_method': body_data.get('payment_method', 'cash'),
+        'allow_partial': bool(body_data.get('allow_partial', False)),
+        'token': token,
+        'items': json.dumps(items, ensure_ascii=False)
+    })
+    order_id, shortages = cur.fetchone()
+    return order_id, shortages
+
+def change_status(cur, order_ids: List[int], status: str) -> List[Dict[str, Any]]:
+    """
+    Переводит заказы в status одним запросом, если переход допустим по ORDER_STATUS_TRANSITIONS.
+    При отмене остатки позиций возвращаются на склад, а заказ вычитается из счётчиков клиента.
+    Возвращает по каждому id результат updated / invalid_transition / not_found и прежний статус.
+    """
+    from_statuses = [source for source, targets in ORDER_STATUS_TRANSITIONS.items() if status in targets]
+    cur.execute(CHANGE_STATUS_SQL, {'ids': order_ids, 'status': status, 'from_statuses': from_statuses})
+    results = []
+    for order_id, previous, changed in cur.fetchall():
+        if changed:
+            result = 'updated'
+        elif previous is None:
+            result = 'not_found'
+        else:
+            result = 'invalid_transition'
+        results.append({'id': order_id, 'result': result, 'previous_status': previous})
+    return results
+
+def order_from_row(row: Tuple[Any, ...]) -> Dict[str, Any]:
+    order = dict(zip(ORDER_FIELDS, row))
+    order['created_at'] = order['created_at'].isoformat() if order['created_at'] else None
+    return order
+
+def attach_items(cur, orders: List[Dict[str, Any]]) -> None:
+    """Позиции сразу для всех заказов одним запросом order_id = ANY(...)."""
+    by_id = {order['id']: order for order in orders}
+    for order in orders:
+        order['items'] = []
+    if not by_id:
+        return
+    cur.execute(
+        "SELECT order_id, product_id, product_name, quantity, price FROM order_items "
+        "WHERE order_id = ANY(%s) ORDER BY order_id, id",
+        (list(by_id),)
+    )
+    for order_id, product_id, product_name, quantity, price in cur.fetchall():
+        by_id[order_id]['items'].append(
+            {'product_id': product_id, 'product_name': product_name, 'quantity': quantity, 'price': price}
+        )
+
+def fetch_orders_by_ids(cur, order_ids: List[int]) -> List[Dict[str, Any]]:
+    cur.execute(
+        "SELECT " + ", ".join(ORDER_FIELDS) + " FROM orders WHERE id = ANY(%s) ORDER BY id",
+        (order_ids,)
+    )
+    orders = [order_from_row(row) for row in cur.fetchall()]
+    attach_items(cur, orders)
+    return orders
+
+def list_orders(cur, params: Dict[str, Any], limit: int) -> Dict[str, Any]:
+    """
+    Страница заказов по ключу (created_at, id) от новых к старым с фильтрами status,
+    date_from/date_to, delivery_method и payment_method; include=items добавляет позиции.
+    """
+    conditions = []
+    args: Dict[str, Any] = {'limit': limit + 1}
+    for key in ('status', 'delivery_method', 'payment_method'):
+        if params.get(key):
+            conditions.append("%s = %%(%s)s" % (key, key))
+            args[key] = params[key]
+    if params.get('date_from'):
+        conditions.append("created_at >= %(date_from)s")
+        args['date_from'] = date.fromisoformat(params['date_from'])
+    if params.get('date_to'):
+        conditions.append("created_at < %(date_to)s::DATE + 1")
+        args['date_to'] = date.fromisoformat(params['date_to'])
+    if params.get('cursor'):
+        args['cursor_created_at'], args['cursor_id'] = decode_cursor(params['cursor'], datetime.fromisoformat, int)
+        conditions.append("(created_at, id) < (%(cursor_created_at)s, %(cursor_id)s)")
+    
+    query = "SELECT " + ", ".join(ORDER_FIELDS) + " FROM orders"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY created_at DESC, id DESC LIMIT %(limit)s"
+    
+    cur.execute(query, args)
+    rows = cur.fetchall()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][-1], rows[-1][0])
+    
+    orders = [order_from_row(row) for row in rows]
+    if 'items' in (params.get('include') or '').split(','):
+        attach_items(cur, orders)
+    return {'items': orders, 'next_cursor': next_cursor}
+
+@http_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     API для работы с заказами питомника
-    POST / - создать заказ
-    GET / - получить все заказы (админ)
-    GET /?id=1 - получить конкретный заказ
+    POST / - создать заказ с резервированием остатков (409 при нехватке, allow_partial - урезать позиции)
+    POST /?action=quote - расчёт корзины по текущим ценам и скидке клиента
+    POST /?action=status - смена статуса {"ids": [1, 2], "status": "confirmed"} (админ, X-Auth-Token):
+        pending -> confirmed -> packed -> shipped -> delivered, отмена до отгрузки возвращает остатки
+    GET / - последние 50 заказов (админ)
+    GET /?status=&date_from=&date_to=&delivery_method=&payment_method=&limit=&cursor=&include=items
+        - постраничный список {items, next_cursor}, позиции всей страницы одним запросом (админ)
+    GET /?id=1 - получить конкретный заказ с позициями
+    GET /?ids=1,2,3 - несколько заказов с позициями за два запроса
     """
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Key',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return options_response('GET, POST, OPTIONS', 'Content-Type, X-Admin-Key, X-Auth-Token')
     
-    dsn = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(dsn)
+    conn = db.acquire()
     cur = conn.cursor()
     
     try:
-        if method == 'POST':
+        params = event.get('queryStringParameters') or {}
+        
+        if method == 'POST' and params.get('action') == 'quote':
             body_data = json.loads(event.get('body', '{}'))
+            try:
+                quote = quote_cart(cur, body_data.get('items', []), get_auth_token(event))
+            except ValueError as e:
+                return error_response(400, str(e))
             
-            cur.execute(
-                "INSERT INTO orders (customer_name, customer_phone, customer_email, customer_address, "
-                "total_amount, delivery_method, payment_method) "
-                "VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id",
-                (
-                    body_data['customer_name'], body_data['customer_phone'],
-                    body_data.get('customer_email', ''), body_data.get('customer_address', ''),
-                    body_data['total_amount'], body_data.get('delivery_method', 'pickup'),
-                    body_data.get('payment_method', 'cash')
-                )
-            )
-            order_id = cur.fetchone()[0]
+            return json_response(200, quote)
+        
+        elif method == 'POST' and params.get('action') == 'status':
+            denied = require_admin(cur, event)
+            if denied:
+                return denied
+            
+            body_data = json.loads(event.get('body') or '{}')
+            status = body_data.get('status')
+            order_ids = body_data.get('ids')
             
-            for item in body_data.get('items', []):
-                cur.execute(
-                    "INSERT INTO order_items (order_id, product_id, product_name, quantity, price) "
-                    "VALUES (%s, %s, %s, %s, %s)",
-                    (order_id, item['product_id'], item['product_name'], item['quantity'], item['price'])
-                )
+            if status not in ORDER_STATUS_TRANSITIONS:
+                return error_response(400, 'status must be one of ' + ', '.join(ORDER_STATUS_TRANSITIONS))
+            if not isinstance(order_ids, list) or not order_ids:
+                return error_response(400, 'ids must be a non-empty list')
+            if len(order_ids) > STATUS_MAX_IDS:
+                return error_response(400, 'At most %d ids per request' % STATUS_MAX_IDS)
+            if not all(isinstance(i, int) and not isinstance(i, bool) for i in order_ids):
+                return error_response(400, 'ids must be integers')
             
+            results = change_status(cur, order_ids, status)
             conn.commit()
             
-            return {
-                'statusCode': 201,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'order_id': order_id, 'message': 'Order created successfully'}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(200, {
+                'updated': sum(1 for r in results if r['result'] == 'updated'),
+                'results': results
+            })
+        
+        elif method == 'POST':
+            body_data = json.loads(event.get('body', '{}'))
+            if not body_data.get('items'):
+                return error_response(400, 'Order items required')
+            
+            token = get_auth_token(event)
+            try:
+                quote = quote_cart(cur, body_data['items'], token)
+            except ValueError as e:
+                return error_response(400, str(e))
+            if quote['missing']:
+                return error_response(400, 'Unknown products', missing=quote['missing'])
+            
+            order_id, shortages = create_order(cur, dict(body_data, items=quote['items']), token)
+            if order_id is None:
+                conn.rollback()
+                return error_response(409, 'Insufficient stock', shortages=shortages)
+            conn.commit()
+            
+            return json_response(201, {
+                'order_id': order_id,
+                'message': 'Order created successfully',
+                'shortages': shortages
+            })
         
         elif method == 'GET':
-            params = event.get('queryStringParameters') or {}
             order_id = params.get('id')
             
             if order_id:
-                cur.execute(
-                    "SELECT id, customer_name, customer_phone, customer_email, customer_address, "
-                    "total_amount, status, delivery_method, payment_method, created_at "
-                    "FROM orders WHERE id = %s",
-                    (order_id,)
-                )
-                row = cur.fetchone()
-                if not row:
-                    return {
-                        'statusCode': 404,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Order not found'}),
-                        'isBase64Encoded': False
-                    }
-                
-                order = {
-                    'id': row[0], 'customer_name': row[1], 'customer_phone': row[2],
-                    'customer_email': row[3], 'customer_address': row[4], 'total_amount': row[5],
-                    'status': row[6], 'delivery_method': row[7], 'payment_method': row[8],
-                    'created_at': row[9].isoformat() if row[9] else None
-                }
+                orders = fetch_orders_by_ids(cur, [int(order_id)])
+                if not orders:
+                    return error_response(404, 'Order not found')
                 
-                cur.execute(
-                    "SELECT product_name, quantity, price FROM order_items WHERE order_id = %s",
-                    (order_id,)
-                )
-                order['items'] = [
-                    {'product_name': r[0], 'quantity': r[1], 'price': r[2]}
-                    for r in cur.fetchall()
-                ]
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps(order, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
+                return json_response(200, orders[0])
             
-            cur.execute(
-                "SELECT id, customer_name, customer_phone, total_amount, status, created_at "
-                "FROM orders ORDER BY created_at DESC LIMIT 50"
-            )
+            if params.get('ids'):
+                try:
+                    order_ids = [int(i) for i in params['ids'].split(',') if i.strip()]
+                except ValueError:
+                    return error_response(400, 'ids must be a comma-separated list of integers')
+                if len(order_ids) > ORDERS_MAX_IDS:
+                    return error_response(400, 'At most %d ids per request' % ORDERS_MAX_IDS)
+                
+                return json_response(200, fetch_orders_by_ids(cur, order_ids))
             
-            orders = []
-            for row in cur.fetchall():
-                orders.append({
-                    'id': row[0], 'customer_name': row[1], 'customer_phone': row[2],
-                    'total_amount': row[3], 'status': row[4],
-                    'created_at': row[5].isoformat() if row[5] else None
-                })
+            paginated = any(params.get(key) for key in ORDER_LIST_PARAMS)
+            try:
+                page = list_orders(cur, params, parse_limit(params.get('limit'), ORDERS_DEFAULT_LIMIT, ORDERS_MAX_LIMIT))
+            except ValueError as e:
+                return error_response(400, str(e))
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(orders, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(200, page if paginated else page['items'])
         
         else:
-            return {
-                'statusCode': 405,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Method not allowed'}),
-                'isBase64Encoded': False
-            }
+            return error_response(405, 'Method not allowed')
     
     finally:
         cur.close()
-        conn.close()
+        db.release(conn)
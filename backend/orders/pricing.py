@@ -0,0 +1,99 @@
+"""
+Цены клиента: прайс-листы, индивидуальные цены и скидки.
+
+Как db.py и response.py, модуль лежит одинаковой копией в backend/products, orders и admin.
+
+Эффективная цена товара для клиента - минимальная из:
+  - custom_price из его прайс-листа (customers.price_list_id),
+  - базовой цены со скидкой прайс-листа (price_lists.discount_percent),
+  - базовой цены с личной скидкой клиента (customers.discount_percent).
+Прайс-лист учитывается, только если он активен и сегодня в его сроке действия.
+
+Для клиентов с прайс-листом цены заранее раскладываются в таблицу customer_prices
+(refresh_customer_prices вызывается при изменении прайс-листов, назначений, скидок и базовых
+цен), поэтому запросу каталога или корзины достаточно одного LEFT JOIN: если строки нет,
+действует личная скидка.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+CUSTOMER_BY_TOKEN_SQL = """
+    SELECT c.id, COALESCE(c.discount_percent, 0) AS discount_percent, c.price_list_id
+    FROM sessions s
+    JOIN customers c ON c.user_id = s.user_id
+    WHERE s.token = %(token)s AND s.expires_at > CURRENT_TIMESTAMP
+"""
+
+
+def customer_prices_join(customer_id_sql: str = '%(pricing_customer_id)s') -> str:
+    """LEFT JOIN действующей цены клиента к products p (алиас cp)."""
+    return """
+    LEFT JOIN customer_prices cp
+        ON cp.customer_id = %s AND cp.product_id = p.id
+       AND CURRENT_DATE BETWEEN cp.valid_from AND cp.valid_to
+""" % customer_id_sql
+
+
+def effective_price_sql(discount_sql: str = '%(pricing_discount)s') -> str:
+    """Цена из customer_prices, а без неё - базовая с личной скидкой."""
+    return "COALESCE(cp.price, ROUND(p.price * (100 - %s) / 100.0)::INTEGER)" % discount_sql
+
+
+CLEAR_CUSTOMER_PRICES_SQL = """
+    DELETE FROM customer_prices
+    WHERE (%(customer_ids)s::INTEGER[] IS NULL OR customer_id = ANY(%(customer_ids)s::INTEGER[]))
+      AND (%(product_ids)s::INTEGER[] IS NULL OR product_id = ANY(%(product_ids)s::INTEGER[]))
+"""
+
+REFRESH_CUSTOMER_PRICES_SQL = """
+    INSERT INTO customer_prices (customer_id, product_id, price_list_id, price, valid_from, valid_to)
+    SELECT c.id, p.id, l.id,
+           LEAST(
+               i.custom_price,
+               ROUND(p.price * (100 - COALESCE(l.discount_percent, 0)) / 100.0),
+               ROUND(p.price * (100 - COALESCE(c.discount_percent, 0)) / 100.0)
+           )::INTEGER,
+           COALESCE(l.valid_from, '-infinity'::DATE),
+           COALESCE(l.valid_to, 'infinity'::DATE)
+    FROM customers c
+    JOIN price_lists l ON l.id = c.price_list_id AND l.is_active
+    CROSS JOIN products p
+    LEFT JOIN (
+        SELECT price_list_id, product_id, MIN(custom_price) AS custom_price
+        FROM price_list_items
+        WHERE custom_price IS NOT NULL
+        GROUP BY price_list_id, product_id
+    ) i ON i.price_list_id = l.id AND i.product_id = p.id
+    WHERE (i.custom_price IS NOT NULL OR COALESCE(l.discount_percent, 0) > 0)
+      AND (%(customer_ids)s::INTEGER[] IS NULL OR c.id = ANY(%(customer_ids)s::INTEGER[]))
+      AND (%(product_ids)s::INTEGER[] IS NULL OR p.id = ANY(%(product_ids)s::INTEGER[]))
+"""
+
+
+def find_customer(cur, token: Optional[str]) -> Optional[Tuple[int, int, Optional[int]]]:
+    """(id клиента, личная скидка, id прайс-листа) по токену сессии или None."""
+    if not token:
+        return None
+    cur.execute(CUSTOMER_BY_TOKEN_SQL, {'token': token})
+    return cur.fetchone()
+
+
+def has_custom_prices(customer: Optional[Tuple[int, int, Optional[int]]]) -> bool:
+    return customer is not None and (customer[1] > 0 or customer[2] is not None)
+
+
+def pricing_params(customer: Optional[Tuple[int, int, Optional[int]]]) -> Dict[str, Any]:
+    if customer is None:
+        return {'pricing_customer_id': None, 'pricing_discount': 0}
+    return {'pricing_customer_id': customer[0], 'pricing_discount': customer[1]}
+
+
+def refresh_customer_prices(cur, customer_ids: Optional[List[int]] = None,
+                            product_ids: Optional[List[int]] = None) -> int:
+    """
+    Пересчитывает customer_prices для указанных клиентов и/или товаров (None - все).
+    Работает в транзакции вызывающего; возвращает число записанных строк.
+    """
+    params = {'customer_ids': customer_ids, 'product_ids': product_ids}
+    cur.execute(CLEAR_CUSTOMER_PRICES_SQL, params)
+    cur.execute(REFRESH_CUSTOMER_PRICES_SQL, params)
+    return cur.rowcount
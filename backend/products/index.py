@@ -1,33 +1,240 @@
 import json
 import os
-import psycopg2
-from typing import Dict, Any
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
 
+import db
+import pricing
+from response import (
+    http_handler, json_response, error_response, body_response, options_response, dumps,
+    get_auth_token, make_etag, etag_matches, parse_limit, encode_cursor, decode_cursor
+)
+
+CATALOG_VERSION_TTL = float(os.environ.get('CATALOG_VERSION_TTL', '5'))
+CATALOG_CACHE_MAX_ENTRIES = 64
+
+LIST_FIELDS = ['id', 'name', 'category', 'price', 'description', 'image_url', 'badge', 'stock']
+PAGE_DEFAULT_LIMIT = 50
+PAGE_MAX_LIMIT = 200
+
+PATCH_TEXT_FIELDS = ('name', 'category', 'description', 'image_url', 'badge')
+PATCH_INT_FIELDS = ('price', 'stock')
+PATCH_REQUIRED_FIELDS = ('name', 'category', 'price', 'stock')
+PATCH_MAX_BATCH = 1000
+
+PATCH_PRODUCTS_SQL = """
+    WITH input AS (
+        SELECT * FROM ROWS FROM (
+            jsonb_to_recordset(%s::jsonb) AS (id INTEGER, changes JSONB, updated_at TIMESTAMP)
+        ) WITH ORDINALITY AS x(id, changes, updated_at, position)
+    ), applied AS (
+        UPDATE products p SET
+            name = CASE WHEN i.changes ? 'name' THEN i.changes->>'name' ELSE p.name END,
+            category = CASE WHEN i.changes ? 'category' THEN i.changes->>'category' ELSE p.category END,
+            price = CASE WHEN i.changes ? 'price' THEN (i.changes->>'price')::INTEGER ELSE p.price END,
+            description = CASE WHEN i.changes ? 'description' THEN i.changes->>'description' ELSE p.description END,
+            image_url = CASE WHEN i.changes ? 'image_url' THEN i.changes->>'image_url' ELSE p.image_url END,
+            badge = CASE WHEN i.changes ? 'badge' THEN i.changes->>'badge' ELSE p.badge END,
+            stock = CASE WHEN i.changes ? 'stock' THEN (i.changes->>'stock')::INTEGER ELSE p.stock END,
+            updated_at = clock_timestamp()
+        FROM input i
+        WHERE p.id = i.id AND (i.updated_at IS NULL OR p.updated_at = i.updated_at)
+        RETURNING p.id, p.updated_at
+    )
+    SELECT i.id,
+           CASE WHEN a.id IS NOT NULL THEN 'updated' WHEN cur.id IS NOT NULL THEN 'conflict' ELSE 'not_found' END,
+           COALESCE(a.updated_at, cur.updated_at)
+    FROM input i
+    LEFT JOIN applied a ON a.id = i.id
+    LEFT JOIN products cur ON cur.id = i.id
+    ORDER BY i.position
+"""
+
+_catalog_cache: Dict[str, Any] = {'version': None, 'checked_at': 0.0, 'bodies': OrderedDict()}
+
+def get_catalog_version(cur) -> Tuple[Any, ...]:
+    """
+    Версия каталога: число строк и последнее изменение. Перепроверяется не чаще раза в CATALOG_VERSION_TTL секунд.
+    Все записи в products ставят updated_at = clock_timestamp() (время записи, а не начала транзакции),
+    поэтому изменение не теряется, если только между штампом и коммитом не закоммитилась другая запись.
+    """
+    now = time.monotonic()
+    if _catalog_cache['version'] is not None and now - _catalog_cache['checked_at'] < CATALOG_VERSION_TTL:
+        return _catalog_cache['version']
+    
+    cur.execute("SELECT COUNT(*), MAX(updated_at) FROM products")
+    count, last_updated = cur.fetchone()
+    version = (count, last_updated.isoformat() if last_updated else None)
+    if version != _catalog_cache['version']:
+        _catalog_cache['bodies'] = OrderedDict()
+        _catalog_cache['version'] = version
+    _catalog_cache['checked_at'] = now
+    return version
+
+def invalidate_catalog() -> None:
+    _catalog_cache['version'] = None
+    _catalog_cache['bodies'] = OrderedDict()
+
+def cache_body(cache_key: str, cached: Tuple[str, str]) -> None:
+    """Кладёт тело в кэш каталога; при переполнении вытесняется давно не запрошенное (LRU)."""
+    bodies = _catalog_cache['bodies']
+    bodies[cache_key] = cached
+    bodies.move_to_end(cache_key)
+    while len(bodies) > CATALOG_CACHE_MAX_ENTRIES:
+        bodies.popitem(last=False)
+
+def parse_fields(raw: Optional[str]) -> List[str]:
+    if not raw:
+        return LIST_FIELDS
+    requested = {f.strip() for f in raw.split(',') if f.strip()}
+    unknown = requested - set(LIST_FIELDS)
+    if unknown:
+        raise ValueError('Unknown fields: ' + ', '.join(sorted(unknown)))
+    requested.add('id')
+    return [f for f in LIST_FIELDS if f in requested]
+
+def select_columns(fields: List[str], customer: Optional[Tuple[int, int, Optional[int]]]) -> Tuple[List[str], List[str]]:
+    """
+    Колонки SELECT по алиасу p и ключи результата. Для клиента с персональными ценами
+    price - эффективная цена, а исходная добавляется как base_price.
+    """
+    columns, keys = [], []
+    for field in fields:
+        if field == 'price' and customer is not None:
+            columns.extend([pricing.effective_price_sql(), 'p.price'])
+            keys.extend(['price', 'base_price'])
+        else:
+            columns.append('p.' + field)
+            keys.append(field)
+    return columns, keys
+
+def products_from(customer: Optional[Tuple[int, int, Optional[int]]]) -> str:
+    return " FROM products p" + (pricing.customer_prices_join() if customer is not None else "")
+
+def fetch_product_page(cur, category: Optional[str], fields: List[str],
+                       cursor: Optional[Tuple[datetime, int]], limit: Optional[int],
+                       customer: Optional[Tuple[int, int, Optional[int]]] = None) -> Dict[str, Any]:
+    """Страница каталога по ключу (created_at, id); при limit=None отдаются все товары."""
+    conditions = []
+    args: Dict[str, Any] = pricing.pricing_params(customer)
+    if category:
+        conditions.append("p.category = %(category)s")
+        args['category'] = category
+    if cursor:
+        conditions.append("(p.created_at, p.id) < (%(cursor_created_at)s, %(cursor_id)s)")
+        args['cursor_created_at'], args['cursor_id'] = cursor
+    
+    columns, keys = select_columns(fields, customer)
+    query = "SELECT " + ", ".join(columns) + ", p.created_at" + products_from(customer)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY p.created_at DESC, p.id DESC"
+    if limit is not None:
+        query += " LIMIT %(limit)s"
+        args['limit'] = limit + 1
+    
+    cur.execute(query, args)
+    rows = cur.fetchmany(limit + 1) if limit is not None else cur.fetchall()
+    
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[-1], last[keys.index('id')])
+    
+    items = [dict(zip(keys, row[:-1])) for row in rows]
+    return {'items': items, 'next_cursor': next_cursor}
+
+def search_products(cur, query: str, category: Optional[str], fields: List[str], limit: int,
+                    customer: Optional[Tuple[int, int, Optional[int]]] = None) -> List[Dict[str, Any]]:
+    """Полнотекстовый поиск (russian) по названию и описанию плюс триграммы по названию для опечаток."""
+    conditions = ["(p.search_vector @@ websearch_to_tsquery('russian', %(q)s) OR %(q)s <%% p.name)"]
+    args: Dict[str, Any] = dict(pricing.pricing_params(customer), q=query, limit=limit)
+    if category:
+        conditions.append("p.category = %(category)s")
+        args['category'] = category
+    
+    columns, keys = select_columns(fields, customer)
+    cur.execute(
+        "SELECT " + ", ".join(columns) + products_from(customer) + " "
+        "WHERE " + " AND ".join(conditions) + " "
+        "ORDER BY ts_rank(p.search_vector, websearch_to_tsquery('russian', %(q)s)) * 2 "
+        "+ word_similarity(%(q)s, p.name) DESC, p.id DESC "
+        "LIMIT %(limit)s",
+        args
+    )
+    return [dict(zip(keys, row)) for row in cur.fetchall()]
+
+def validate_patch(update: Any) -> Dict[str, Any]:
+    """Проверяет элемент {id, changes, updated_at?}: только известные поля, обязательные не null, цены и остатки - целые >= 0."""
+    if not isinstance(update, dict) or not isinstance(update.get('changes'), dict):
+        raise ValueError('Each update must be an object with changes')
+    try:
+        product_id = int(update.get('id'))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid product id')
+    
+    changes = update['changes']
+    unknown = set(changes) - set(PATCH_TEXT_FIELDS) - set(PATCH_INT_FIELDS)
+    if unknown:
+        raise ValueError('Unknown fields: ' + ', '.join(sorted(unknown)))
+    if not changes:
+        raise ValueError('No changes for product %d' % product_id)
+    for field, value in changes.items():
+        if value is None:
+            if field in PATCH_REQUIRED_FIELDS:
+                raise ValueError('%s cannot be null' % field)
+        elif field in PATCH_INT_FIELDS:
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                raise ValueError('%s must be a non-negative integer' % field)
+        elif not isinstance(value, str):
+            raise ValueError('%s must be a string' % field)
+        elif field in PATCH_REQUIRED_FIELDS and not value.strip():
+            raise ValueError('%s cannot be empty' % field)
+    
+    updated_at = update.get('updated_at')
+    if updated_at is not None:
+        try:
+            datetime.fromisoformat(updated_at)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid updated_at')
+    return {'id': product_id, 'changes': changes, 'updated_at': updated_at}
+
+def patch_products(cur, updates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Применяет частичные изменения одним UPDATE. Если в элементе передан updated_at, строка
+    меняется только при совпадении с текущим значением (оптимистичная блокировка).
+    Возвращает по каждому id статус updated / conflict / not_found и актуальный updated_at.
+    """
+    cur.execute(PATCH_PRODUCTS_SQL, (json.dumps(updates),))
+    return [
+        {'id': row[0], 'status': row[1], 'updated_at': row[2].isoformat() if row[2] else None}
+        for row in cur.fetchall()
+    ]
+
+@http_handler
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     API для работы с товарами питомника
     GET / - получить все товары
     GET /?category=peonies - фильтр по категории
+    GET /?limit=50&cursor=...&fields=id,name,price - постраничный список {items, next_cursor}
+    GET /?q=пион сара бернар - поиск по названию и описанию с учётом опечаток {items}, без cursor
+    Списки отдаются из кэша по версии каталога с ETag, If-None-Match -> 304
+    С X-Auth-Token клиента со скидкой или прайс-листом price - его цена, base_price - исходная (без кэша)
     POST / - добавить товар (админ)
-    PUT /?id=1 - обновить товар (админ)
+    PUT /?id=1 - обновить товар целиком (админ)
+    PATCH /?id=1 - изменить только переданные поля, {"stock": 40, "updated_at": "..."} (админ)
+    PATCH / - пакетное изменение {"updates": [{"id": 1, "changes": {"stock": 40}, "updated_at": "..."}]} (админ)
     """
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Key',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return options_response('GET, POST, PUT, PATCH, OPTIONS', 'Content-Type, X-Admin-Key, X-Auth-Token, If-None-Match')
     
-    dsn = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(dsn)
+    conn = db.acquire()
     cur = conn.cursor()
     
     try:
@@ -36,58 +243,68 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             category = params.get('category')
             product_id = params.get('id')
             
+            customer = pricing.find_customer(cur, get_auth_token(event))
+            if not pricing.has_custom_prices(customer):
+                customer = None
+            
             if product_id:
+                columns, keys = select_columns(LIST_FIELDS, customer)
                 cur.execute(
-                    "SELECT id, name, category, price, description, image_url, badge, stock, created_at "
-                    "FROM products WHERE id = %s",
-                    (product_id,)
+                    "SELECT " + ", ".join(columns) + ", p.created_at, p.updated_at"
+                    + products_from(customer) + " WHERE p.id = %(id)s",
+                    dict(pricing.pricing_params(customer), id=product_id)
                 )
                 row = cur.fetchone()
                 if not row:
-                    return {
-                        'statusCode': 404,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Product not found'}),
-                        'isBase64Encoded': False
-                    }
+                    return error_response(404, 'Product not found')
                 
-                product = {
-                    'id': row[0], 'name': row[1], 'category': row[2], 'price': row[3],
-                    'description': row[4], 'image_url': row[5], 'badge': row[6],
-                    'stock': row[7], 'created_at': row[8].isoformat() if row[8] else None
-                }
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps(product, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
-            
-            if category:
-                cur.execute(
-                    "SELECT id, name, category, price, description, image_url, badge, stock "
-                    "FROM products WHERE category = %s ORDER BY created_at DESC",
-                    (category,)
-                )
+                product = dict(zip(keys, row[:-2]))
+                product['created_at'] = row[-2].isoformat() if row[-2] else None
+                product['updated_at'] = row[-1].isoformat() if row[-1] else None
+                return json_response(200, product)
+            
+            search_query = (params.get('q') or '').strip()
+            paginated = any(params.get(key) for key in ('limit', 'cursor', 'fields'))
+            try:
+                fields = parse_fields(params.get('fields'))
+                limit = parse_limit(params.get('limit'), PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT) if paginated else None
+                cursor = decode_cursor(params['cursor'], datetime.fromisoformat, int) if params.get('cursor') else None
+            except ValueError as e:
+                return error_response(400, str(e))
+            
+            if search_query:
+                if cursor:
+                    return error_response(400, 'cursor is not supported with q')
+                items = search_products(cur, search_query, category, fields, limit or PAGE_DEFAULT_LIMIT, customer)
+                return json_response(200, {'items': items})
+            
+            if customer is not None:
+                page = fetch_product_page(cur, category, fields, cursor, limit, customer)
+                return json_response(200, page if paginated else page['items'], {'Cache-Control': 'private, no-cache'})
+            
+            get_catalog_version(cur)
+            cache_key = category or ''
+            if paginated:
+                cache_key = '|'.join([cache_key, ','.join(fields), params.get('cursor') or '', str(limit)])
+            cached = _catalog_cache['bodies'].get(cache_key)
+            
+            if cached is not None:
+                _catalog_cache['bodies'].move_to_end(cache_key)
             else:
-                cur.execute(
-                    "SELECT id, name, category, price, description, image_url, badge, stock "
-                    "FROM products ORDER BY created_at DESC"
-                )
+                page = fetch_product_page(cur, category, fields, cursor, limit)
+                products = page if paginated else page['items']
+                
+                body = dumps(products)
+                cached = (body, make_etag(body))
+                cache_body(cache_key, cached)
+            
+            body, etag = cached
+            cache_headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
             
-            products = []
-            for row in cur.fetchall():
-                products.append({
-                    'id': row[0], 'name': row[1], 'category': row[2], 'price': row[3],
-                    'description': row[4], 'image_url': row[5], 'badge': row[6], 'stock': row[7]
-                })
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(products, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            if etag_matches(event.get('headers') or {}, etag):
+                return body_response(304, '', cache_headers)
+            
+            return body_response(200, body, cache_headers)
         
         elif method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
@@ -102,31 +319,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 )
             )
             new_id = cur.fetchone()[0]
+            pricing.refresh_customer_prices(cur, product_ids=[new_id])
             conn.commit()
+            invalidate_catalog()
             
-            return {
-                'statusCode': 201,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'id': new_id, 'message': 'Product created'}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(201, {'id': new_id, 'message': 'Product created'})
         
         elif method == 'PUT':
             params = event.get('queryStringParameters') or {}
             product_id = params.get('id')
             if not product_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Product ID required'}),
-                    'isBase64Encoded': False
-                }
+                return error_response(400, 'Product ID required')
             
             body_data = json.loads(event.get('body', '{}'))
             
             cur.execute(
                 "UPDATE products SET name=%s, category=%s, price=%s, description=%s, "
-                "image_url=%s, badge=%s, stock=%s, updated_at=CURRENT_TIMESTAMP "
+                "image_url=%s, badge=%s, stock=%s, updated_at=clock_timestamp() "
                 "WHERE id=%s",
                 (
                     body_data['name'], body_data['category'], body_data['price'],
@@ -134,23 +343,60 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     body_data.get('badge'), body_data.get('stock', 0), product_id
                 )
             )
+            pricing.refresh_customer_prices(cur, product_ids=[int(product_id)])
             conn.commit()
+            invalidate_catalog()
+            
+            return json_response(200, {'message': 'Product updated'})
+        
+        elif method == 'PATCH':
+            params = event.get('queryStringParameters') or {}
+            product_id = params.get('id')
+            body_data = json.loads(event.get('body') or '{}')
+            
+            try:
+                if product_id:
+                    changes = {k: v for k, v in body_data.items() if k != 'updated_at'}
+                    updates = [validate_patch({
+                        'id': product_id, 'changes': changes, 'updated_at': body_data.get('updated_at')
+                    })]
+                else:
+                    raw_updates = body_data.get('updates')
+                    if not isinstance(raw_updates, list) or not raw_updates:
+                        return error_response(400, 'updates must be a non-empty list')
+                    if len(raw_updates) > PATCH_MAX_BATCH:
+                        return error_response(400, 'At most %d updates per request' % PATCH_MAX_BATCH)
+                    updates = [validate_patch(update) for update in raw_updates]
+            except ValueError as e:
+                return error_response(400, str(e))
+            
+            if len({u['id'] for u in updates}) != len(updates):
+                return error_response(400, 'Duplicate product ids')
+            
+            results = patch_products(cur, updates)
+            repriced = [u['id'] for u, r in zip(updates, results) if r['status'] == 'updated' and 'price' in u['changes']]
+            if repriced:
+                pricing.refresh_customer_prices(cur, product_ids=repriced)
+            conn.commit()
+            if any(r['status'] == 'updated' for r in results):
+                invalidate_catalog()
+            
+            if product_id:
+                result = results[0]
+                if result['status'] == 'not_found':
+                    return error_response(404, 'Product not found')
+                if result['status'] == 'conflict':
+                    return error_response(409, 'Product was modified', updated_at=result['updated_at'])
+                return json_response(200, result)
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'message': 'Product updated'}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(200, {
+                'updated': sum(1 for r in results if r['status'] == 'updated'),
+                'results': results
+            })
         
         else:
-            return {
-                'statusCode': 405,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Method not allowed'}),
-                'isBase64Encoded': False
-            }
+            return error_response(405, 'Method not allowed')
     
     finally:
         cur.close()
-        conn.close()
+        db.release(conn)
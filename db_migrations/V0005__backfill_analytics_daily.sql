@@ -0,0 +1,26 @@
+INSERT INTO analytics_daily (date, total_orders, total_revenue, new_customers, avg_order_value)
+SELECT d.date,
+       COALESCE(o.total_orders, 0),
+       COALESCE(o.total_revenue, 0),
+       COALESCE(u.new_customers, 0),
+       COALESCE(o.total_revenue / NULLIF(o.total_orders, 0), 0)
+FROM (
+    SELECT DATE(created_at) AS date FROM orders
+    UNION
+    SELECT DATE(created_at) FROM users WHERE role = 'customer'
+) d
+LEFT JOIN (
+    SELECT DATE(created_at) AS date, COUNT(*) AS total_orders, SUM(total_amount) AS total_revenue
+    FROM orders
+    GROUP BY DATE(created_at)
+) o ON o.date = d.date
+LEFT JOIN (
+    SELECT DATE(created_at) AS date, COUNT(*) AS new_customers
+    FROM users WHERE role = 'customer'
+    GROUP BY DATE(created_at)
+) u ON u.date = d.date
+ON CONFLICT (date) DO UPDATE SET
+    total_orders = EXCLUDED.total_orders,
+    total_revenue = EXCLUDED.total_revenue,
+    new_customers = EXCLUDED.new_customers,
+    avg_order_value = EXCLUDED.avg_order_value;
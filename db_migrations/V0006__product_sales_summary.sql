@@ -0,0 +1,35 @@
+CREATE TABLE IF NOT EXISTS product_sales_summary (
+    product_id INTEGER PRIMARY KEY REFERENCES products(id),
+    times_ordered INTEGER NOT NULL DEFAULT 0,
+    total_quantity INTEGER NOT NULL DEFAULT 0,
+    total_revenue BIGINT NOT NULL DEFAULT 0,
+    last_sold_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS product_sales_daily (
+    product_id INTEGER NOT NULL REFERENCES products(id),
+    date DATE NOT NULL,
+    times_ordered INTEGER NOT NULL DEFAULT 0,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    revenue BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (product_id, date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_product_sales_summary_revenue ON product_sales_summary(total_revenue DESC);
+CREATE INDEX IF NOT EXISTS idx_product_sales_daily_date ON product_sales_daily(date);
+
+INSERT INTO product_sales_summary (product_id, times_ordered, total_quantity, total_revenue, last_sold_at)
+SELECT oi.product_id, COUNT(*), SUM(oi.quantity), SUM(oi.quantity * oi.price), MAX(o.created_at)
+FROM order_items oi
+JOIN orders o ON o.id = oi.order_id
+WHERE oi.product_id IS NOT NULL
+GROUP BY oi.product_id
+ON CONFLICT (product_id) DO NOTHING;
+
+INSERT INTO product_sales_daily (product_id, date, times_ordered, quantity, revenue)
+SELECT oi.product_id, DATE(o.created_at), COUNT(*), SUM(oi.quantity), SUM(oi.quantity * oi.price)
+FROM order_items oi
+JOIN orders o ON o.id = oi.order_id
+WHERE oi.product_id IS NOT NULL
+GROUP BY oi.product_id, DATE(o.created_at)
+ON CONFLICT (product_id, date) DO NOTHING;
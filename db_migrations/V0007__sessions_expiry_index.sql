@@ -0,0 +1,4 @@
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at);
+
+-- sessions.token already has the index behind its UNIQUE constraint
+DROP INDEX IF EXISTS idx_sessions_token;
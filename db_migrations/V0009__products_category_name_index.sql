@@ -0,0 +1 @@
+CREATE INDEX IF NOT EXISTS idx_products_category_name ON products(category, name);
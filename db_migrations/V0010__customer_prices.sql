@@ -0,0 +1,17 @@
+ALTER TABLE customers ADD COLUMN IF NOT EXISTS price_list_id INTEGER REFERENCES price_lists(id);
+
+CREATE INDEX IF NOT EXISTS idx_customers_price_list_id ON customers(price_list_id);
+CREATE INDEX IF NOT EXISTS idx_price_list_items_list_product ON price_list_items(price_list_id, product_id);
+
+-- Effective prices of customers with an active price list, rebuilt by pricing.refresh_customer_prices
+CREATE TABLE IF NOT EXISTS customer_prices (
+    customer_id INTEGER NOT NULL REFERENCES customers(id) ON DELETE CASCADE,
+    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    price_list_id INTEGER NOT NULL REFERENCES price_lists(id) ON DELETE CASCADE,
+    price INTEGER NOT NULL,
+    valid_from DATE NOT NULL,
+    valid_to DATE NOT NULL,
+    PRIMARY KEY (customer_id, product_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_customer_prices_product_id ON customer_prices(product_id);
@@ -0,0 +1,11 @@
+CREATE INDEX IF NOT EXISTS idx_users_email_trgm ON users USING GIN (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_full_name_trgm ON users USING GIN (full_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_phone_digits_trgm ON users USING GIN ((regexp_replace(phone, '\D', '', 'g')) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_company_name_trgm ON customers USING GIN (company_name gin_trgm_ops);
+
+-- Keyset sort keys of the CRM customer list (admin path=customers)
+CREATE INDEX IF NOT EXISTS idx_customers_total_spent_id ON customers ((COALESCE(total_spent, 0)) DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_customers_total_orders_id ON customers ((COALESCE(total_orders, 0)) DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_customers_last_order_date_id ON customers ((COALESCE(last_order_date, '-infinity'::TIMESTAMP)) DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_customers_created_at_id ON customers ((COALESCE(created_at, '-infinity'::TIMESTAMP)) DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_customers_status ON customers(status);
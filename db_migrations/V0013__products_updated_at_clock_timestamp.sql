@@ -0,0 +1,3 @@
+-- The catalog version is MAX(updated_at): stamp rows at write time rather than at
+-- transaction start, otherwise a change committed late may not move the version.
+ALTER TABLE products ALTER COLUMN updated_at SET DEFAULT clock_timestamp();
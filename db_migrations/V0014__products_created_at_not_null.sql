@@ -0,0 +1,3 @@
+-- The product list pages on (created_at, id); a NULL created_at breaks the cursor.
+UPDATE products SET created_at = COALESCE(updated_at, TIMESTAMP 'epoch') WHERE created_at IS NULL;
+ALTER TABLE products ALTER COLUMN created_at SET NOT NULL;
@@ -0,0 +1,3 @@
+-- The admin order list pages on (created_at, id); a NULL created_at breaks the cursor.
+UPDATE orders SET created_at = COALESCE(updated_at, TIMESTAMP 'epoch') WHERE created_at IS NULL;
+ALTER TABLE orders ALTER COLUMN created_at SET NOT NULL;
@@ -1,4 +1,5 @@
 import { Button } from "@/components/ui/button";
+import { Input } from "@/components/ui/input";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs";
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from "@/components/ui/table";
@@ -44,6 +45,8 @@ const AdminDashboard = () => {
   
   const [stats, setStats] = useState<DashboardStats | null>(null);
   const [customers, setCustomers] = useState<Customer[]>([]);
+  const [customerQuery, setCustomerQuery] = useState("");
+  const [customersCursor, setCustomersCursor] = useState<string | null>(null);
   const [productStats, setProductStats] = useState<ProductStats[]>([]);
   const [loading, setLoading] = useState(true);
 
@@ -69,7 +72,7 @@ const AdminDashboard = () => {
           fetch('https://functions.poehali.dev/2dbb4d37-50d4-4ae3-b44d-b3bbdc2a7dfc?path=dashboard', {
             headers: { 'X-Auth-Token': token || '' }
           }),
-          fetch('https://functions.poehali.dev/2dbb4d37-50d4-4ae3-b44d-b3bbdc2a7dfc?path=customers', {
+          fetch('https://functions.poehali.dev/2dbb4d37-50d4-4ae3-b44d-b3bbdc2a7dfc?path=customers&limit=50', {
             headers: { 'X-Auth-Token': token || '' }
           }),
           fetch('https://functions.poehali.dev/2dbb4d37-50d4-4ae3-b44d-b3bbdc2a7dfc?path=products/stats', {
@@ -84,7 +87,8 @@ const AdminDashboard = () => {
         ]);
 
         setStats(statsData);
-        setCustomers(customersData);
+        setCustomers(customersData.items);
+        setCustomersCursor(customersData.next_cursor);
         setProductStats(productsData);
       } catch (error) {
         console.error('Error fetching data:', error);
@@ -101,6 +105,32 @@ const AdminDashboard = () => {
     fetchData();
   }, [user, isAdmin, token, navigate, toast]);
 
+  const fetchCustomers = async (query: string, cursor: string | null) => {
+    const params = new URLSearchParams({ path: 'customers', limit: '50' });
+    if (query) params.set('q', query);
+    if (cursor) params.set('cursor', cursor);
+
+    try {
+      const response = await fetch(`https://functions.poehali.dev/2dbb4d37-50d4-4ae3-b44d-b3bbdc2a7dfc?${params}`, {
+        headers: { 'X-Auth-Token': token || '' }
+      });
+      const data = await response.json();
+      setCustomers(prev => cursor ? [...prev, ...data.items] : data.items);
+      setCustomersCursor(data.next_cursor);
+    } catch (error) {
+      toast({
+        title: "Ошибка загрузки",
+        description: "Не удалось загрузить клиентов",
+        variant: "destructive"
+      });
+    }
+  };
+
+  const handleCustomerSearch = (event: React.FormEvent) => {
+    event.preventDefault();
+    fetchCustomers(customerQuery.trim(), null);
+  };
+
   const handleExportPriceList = async () => {
     try {
       const response = await fetch('https://functions.poehali.dev/2dbb4d37-50d4-4ae3-b44d-b3bbdc2a7dfc?path=export&format=csv');
@@ -124,6 +154,39 @@ const AdminDashboard = () => {
     }
   };
 
+  const handleImportPriceList = async (event: React.ChangeEvent<HTMLInputElement>) => {
+    const file = event.target.files?.[0];
+    event.target.value = '';
+    if (!file) return;
+
+    try {
+      const response = await fetch('https://functions.poehali.dev/2dbb4d37-50d4-4ae3-b44d-b3bbdc2a7dfc?path=import&format=csv', {
+        method: 'POST',
+        headers: { 'Content-Type': 'text/csv; charset=utf-8' },
+        body: await file.text()
+      });
+      const result = await response.json();
+      if (!response.ok) {
+        throw new Error(result.error);
+      }
+
+      const failed = result.errors.length
+        ? `, с ошибками: ${result.errors.length} (строка ${result.errors[0].line}: ${result.errors[0].error})`
+        : '';
+      toast({
+        title: "Прайс-лист импортирован",
+        description: `Добавлено: ${result.inserted}, обновлено: ${result.updated}${failed}`,
+        variant: result.errors.length ? "destructive" : "default"
+      });
+    } catch (error) {
+      toast({
+        title: "Ошибка импорта",
+        description: error instanceof Error && error.message ? error.message : "Не удалось импортировать прайс-лист",
+        variant: "destructive"
+      });
+    }
+  };
+
   if (loading) {
     return (
       <div className="min-h-screen flex items-center justify-center">
@@ -151,6 +214,13 @@ const AdminDashboard = () => {
               <Icon name="FileDown" className="mr-2" size={18} />
               Экспорт прайс-листа
             </Button>
+            <Button variant="outline" asChild>
+              <label className="cursor-pointer">
+                <Icon name="FileUp" className="mr-2" size={18} />
+                Импорт прайс-листа
+                <input type="file" accept=".csv,text/csv" className="hidden" onChange={handleImportPriceList} />
+              </label>
+            </Button>
           </div>
         </div>
 
@@ -216,8 +286,19 @@ const AdminDashboard = () => {
 
           <TabsContent value="customers">
             <Card>
-              <CardHeader>
+              <CardHeader className="flex flex-row items-center justify-between gap-4">
                 <CardTitle>База клиентов</CardTitle>
+                <form onSubmit={handleCustomerSearch} className="flex gap-2">
+                  <Input
+                    value={customerQuery}
+                    onChange={e => setCustomerQuery(e.target.value)}
+                    placeholder="Email, имя или телефон"
+                    className="w-64"
+                  />
+                  <Button type="submit" variant="outline" size="icon">
+                    <Icon name="Search" size={18} />
+                  </Button>
+                </form>
               </CardHeader>
               <CardContent>
                 <Table>
@@ -238,7 +319,7 @@ const AdminDashboard = () => {
                         <TableCell>{customer.email}</TableCell>
                         <TableCell>{customer.phone}</TableCell>
                         <TableCell className="text-right">{customer.total_orders}</TableCell>
-                        <TableCell className="text-right">{customer.total_spent.toLocaleString()} ₽</TableCell>
+                        <TableCell className="text-right">{(customer.total_spent || 0).toLocaleString()} ₽</TableCell>
                         <TableCell>
                           <span className={`px-2 py-1 rounded text-xs ${
                             customer.status === 'active' 
@@ -252,6 +333,13 @@ const AdminDashboard = () => {
                     ))}
                   </TableBody>
                 </Table>
+                {customersCursor && (
+                  <div className="flex justify-center mt-4">
+                    <Button variant="outline" onClick={() => fetchCustomers(customerQuery.trim(), customersCursor)}>
+                      Показать ещё
+                    </Button>
+                  </div>
+                )}
               </CardContent>
             </Card>
           </TabsContent>
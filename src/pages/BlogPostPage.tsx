@@ -7,6 +7,8 @@ interface BlogPost {
   id: number;
   title: string;
   content: string;
+  content_html?: string;
+  reading_time?: number;
   excerpt: string;
   image_url: string;
   author: string;
@@ -89,28 +91,41 @@ const BlogPostPage = () => {
                   <Icon name="Calendar" size={18} />
                   <span>{new Date(post.created_at).toLocaleDateString('ru-RU')}</span>
                 </div>
+                {post.reading_time && (
+                  <div className="flex items-center gap-2">
+                    <Icon name="Clock" size={18} />
+                    <span>{post.reading_time} мин чтения</span>
+                  </div>
+                )}
               </div>
 
-              <div className="prose prose-lg max-w-none">
-                {post.content.split('\n').map((paragraph, index) => {
-                  if (paragraph.startsWith('**') && paragraph.endsWith('**')) {
-                    return <h3 key={index} className="text-2xl font-bold mt-6 mb-4">{paragraph.replace(/\*\*/g, '')}</h3>;
-                  }
-                  if (paragraph.startsWith('# ')) {
-                    return <h2 key={index} className="text-3xl font-bold mt-8 mb-4">{paragraph.replace('# ', '')}</h2>;
-                  }
-                  if (paragraph.startsWith('- ')) {
-                    return <li key={index} className="ml-6 mb-2">{paragraph.replace('- ', '')}</li>;
-                  }
-                  if (paragraph.match(/^\d+\./)) {
-                    return <li key={index} className="ml-6 mb-2">{paragraph.replace(/^\d+\.\s/, '')}</li>;
-                  }
-                  if (paragraph.trim()) {
-                    return <p key={index} className="mb-4 text-lg leading-relaxed">{paragraph}</p>;
-                  }
-                  return null;
-                })}
-              </div>
+              {post.content_html ? (
+                <div
+                  className="prose prose-lg max-w-none"
+                  dangerouslySetInnerHTML={{ __html: post.content_html }}
+                />
+              ) : (
+                <div className="prose prose-lg max-w-none">
+                  {post.content.split('\n').map((paragraph, index) => {
+                    if (paragraph.startsWith('**') && paragraph.endsWith('**')) {
+                      return <h3 key={index} className="text-2xl font-bold mt-6 mb-4">{paragraph.replace(/\*\*/g, '')}</h3>;
+                    }
+                    if (paragraph.startsWith('# ')) {
+                      return <h2 key={index} className="text-3xl font-bold mt-8 mb-4">{paragraph.replace('# ', '')}</h2>;
+                    }
+                    if (paragraph.startsWith('- ')) {
+                      return <li key={index} className="ml-6 mb-2">{paragraph.replace('- ', '')}</li>;
+                    }
+                    if (paragraph.match(/^\d+\./)) {
+                      return <li key={index} className="ml-6 mb-2">{paragraph.replace(/^\d+\.\s/, '')}</li>;
+                    }
+                    if (paragraph.trim()) {
+                      return <p key={index} className="mb-4 text-lg leading-relaxed">{paragraph}</p>;
+                    }
+                    return null;
+                  })}
+                </div>
+              )}
             </div>
           </div>
         </div>
@@ -6,12 +6,33 @@ import { Textarea } from "@/components/ui/textarea";
 import { RadioGroup, RadioGroupItem } from "@/components/ui/radio-group";
 import Icon from "@/components/ui/icon";
 import { useCart } from "@/lib/cart-context";
+import { useAuth } from "@/lib/auth-context";
 import { Link, useNavigate } from "react-router-dom";
-import { useState } from "react";
+import { useState, useEffect } from "react";
 import { useToast } from "@/hooks/use-toast";
 
+const ORDERS_URL = "https://functions.poehali.dev/89b03535-3b08-457d-b83b-5befc8028447";
+
+interface QuoteLine {
+  product_id: number;
+  product_name: string;
+  quantity: number;
+  base_price: number;
+  price: number;
+  line_total: number;
+  in_stock: boolean;
+}
+
+interface Quote {
+  items: QuoteLine[];
+  missing: number[];
+  discount_percent: number;
+  total_amount: number;
+}
+
 const CartPage = () => {
   const { cart, removeFromCart, updateQuantity, totalAmount, clearCart } = useCart();
+  const { token } = useAuth();
   const navigate = useNavigate();
   const { toast } = useToast();
   
@@ -22,6 +43,51 @@ const CartPage = () => {
   const [deliveryMethod, setDeliveryMethod] = useState("pickup");
   const [paymentMethod, setPaymentMethod] = useState("cash");
   const [isSubmitting, setIsSubmitting] = useState(false);
+  const [quote, setQuote] = useState<Quote | null>(null);
+
+  useEffect(() => {
+    if (cart.length === 0) {
+      setQuote(null);
+      return;
+    }
+
+    let cancelled = false;
+    const fetchQuote = async () => {
+      try {
+        const response = await fetch(`${ORDERS_URL}?action=quote`, {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+            ...(token ? { "X-Auth-Token": token } : {})
+          },
+          body: JSON.stringify({
+            items: cart.map(item => ({ product_id: item.id, quantity: item.quantity }))
+          })
+        });
+        if (!response.ok) {
+          throw new Error("Failed to quote cart");
+        }
+        const data: Quote = await response.json();
+        if (!cancelled) {
+          setQuote(data);
+        }
+      } catch (error) {
+        console.error("Quote error:", error);
+        if (!cancelled) {
+          setQuote(null);
+        }
+      }
+    };
+
+    fetchQuote();
+    return () => {
+      cancelled = true;
+    };
+  }, [cart, token]);
+
+  const quoteLines = new Map((quote?.items ?? []).map(line => [line.product_id, line]));
+  const missingIds = new Set(quote?.missing ?? []);
+  const orderTotal = quote ? quote.total_amount : totalAmount;
 
   const handleSubmitOrder = async (e: React.FormEvent) => {
     e.preventDefault();
@@ -43,7 +109,7 @@ const CartPage = () => {
         customer_phone: customerPhone,
         customer_email: customerEmail,
         customer_address: customerAddress,
-        total_amount: totalAmount,
+        total_amount: orderTotal,
         delivery_method: deliveryMethod,
         payment_method: paymentMethod,
         items: cart.map(item => ({
@@ -54,9 +120,12 @@ const CartPage = () => {
         }))
       };
 
-      const response = await fetch("https://functions.poehali.dev/89b03535-3b08-457d-b83b-5befc8028447", {
+      const response = await fetch(ORDERS_URL, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: {
+          "Content-Type": "application/json",
+          ...(token ? { "X-Auth-Token": token } : {})
+        },
         body: JSON.stringify(orderData)
       });
 
@@ -68,6 +137,16 @@ const CartPage = () => {
         });
         clearCart();
         navigate("/");
+      } else if (response.status === 409) {
+        const result = await response.json();
+        const names = result.shortages
+          .map((s: { product_name: string; available: number }) => `${s.product_name} (в наличии: ${s.available})`)
+          .join(", ");
+        toast({
+          title: "Недостаточно товара",
+          description: names,
+          variant: "destructive"
+        });
       } else {
         throw new Error("Failed to create order");
       }
@@ -107,48 +186,64 @@ const CartPage = () => {
       
       <div className="grid lg:grid-cols-3 gap-8">
         <div className="lg:col-span-2 space-y-4">
-          {cart.map(item => (
-            <Card key={item.id}>
-              <CardContent className="p-4 flex gap-4">
-                <img 
-                  src={item.image_url} 
-                  alt={item.name}
-                  className="w-24 h-24 object-cover rounded"
-                />
-                <div className="flex-1">
-                  <h3 className="font-semibold mb-2">{item.name}</h3>
-                  <p className="text-xl font-bold text-primary mb-2">{item.price} ₽</p>
-                  <div className="flex items-center gap-2">
-                    <Button 
-                      size="sm" 
-                      variant="outline"
-                      onClick={() => updateQuantity(item.id, item.quantity - 1)}
-                    >
-                      <Icon name="Minus" size={16} />
-                    </Button>
-                    <span className="w-12 text-center">{item.quantity}</span>
+          {cart.map(item => {
+            const line = quoteLines.get(item.id);
+            const isMissing = missingIds.has(item.id);
+            const price = line ? line.price : item.price;
+            return (
+              <Card key={item.id} className={isMissing ? "opacity-60" : undefined}>
+                <CardContent className="p-4 flex gap-4">
+                  <img 
+                    src={item.image_url} 
+                    alt={item.name}
+                    className="w-24 h-24 object-cover rounded"
+                  />
+                  <div className="flex-1">
+                    <h3 className="font-semibold mb-2">{item.name}</h3>
+                    <p className="text-xl font-bold text-primary mb-2">
+                      {price} ₽
+                      {line && line.base_price > line.price && (
+                        <span className="ml-2 text-sm font-normal text-muted-foreground line-through">{line.base_price} ₽</span>
+                      )}
+                    </p>
+                    {isMissing && (
+                      <p className="text-sm text-destructive mb-2">Товар больше не продаётся — удалите его из корзины</p>
+                    )}
+                    {line && !line.in_stock && (
+                      <p className="text-sm text-destructive mb-2">Нет в наличии в таком количестве</p>
+                    )}
+                    <div className="flex items-center gap-2">
+                      <Button 
+                        size="sm" 
+                        variant="outline"
+                        onClick={() => updateQuantity(item.id, item.quantity - 1)}
+                      >
+                        <Icon name="Minus" size={16} />
+                      </Button>
+                      <span className="w-12 text-center">{item.quantity}</span>
+                      <Button 
+                        size="sm" 
+                        variant="outline"
+                        onClick={() => updateQuantity(item.id, item.quantity + 1)}
+                      >
+                        <Icon name="Plus" size={16} />
+                      </Button>
+                    </div>
+                  </div>
+                  <div className="text-right">
+                    <p className="font-bold mb-2">{line ? line.line_total : isMissing ? 0 : item.price * item.quantity} ₽</p>
                     <Button 
                       size="sm" 
-                      variant="outline"
-                      onClick={() => updateQuantity(item.id, item.quantity + 1)}
+                      variant="ghost"
+                      onClick={() => removeFromCart(item.id)}
                     >
-                      <Icon name="Plus" size={16} />
+                      <Icon name="Trash2" size={16} />
                     </Button>
                   </div>
-                </div>
-                <div className="text-right">
-                  <p className="font-bold mb-2">{item.price * item.quantity} ₽</p>
-                  <Button 
-                    size="sm" 
-                    variant="ghost"
-                    onClick={() => removeFromCart(item.id)}
-                  >
-                    <Icon name="Trash2" size={16} />
-                  </Button>
-                </div>
-              </CardContent>
-            </Card>
-          ))}
+                </CardContent>
+              </Card>
+            );
+          })}
         </div>
 
         <div>
@@ -230,11 +325,17 @@ const CartPage = () => {
                 </div>
 
                 <div className="border-t pt-4">
+                  {quote && quote.discount_percent > 0 && (
+                    <div className="flex justify-between text-sm text-muted-foreground mb-2">
+                      <span>Ваша скидка:</span>
+                      <span>{quote.discount_percent}%</span>
+                    </div>
+                  )}
                   <div className="flex justify-between text-xl font-bold mb-4">
                     <span>Итого:</span>
-                    <span>{totalAmount} ₽</span>
+                    <span>{orderTotal} ₽</span>
                   </div>
-                  <Button type="submit" className="w-full" size="lg" disabled={isSubmitting}>
+                  <Button type="submit" className="w-full" size="lg" disabled={isSubmitting || missingIds.size > 0}>
                     {isSubmitting ? "Оформление..." : "Оформить заказ"}
                   </Button>
                 </div>
@@ -5,6 +5,7 @@ import Icon from "@/components/ui/icon";
 import { useState, useEffect } from "react";
 import { Link } from "react-router-dom";
 import { useCart } from "@/lib/cart-context";
+import { useAuth } from "@/lib/auth-context";
 import { useToast } from "@/hooks/use-toast";
 
 interface Product {
@@ -12,6 +13,7 @@ interface Product {
   name: string;
   category: string;
   price: number;
+  base_price?: number;
   description: string;
   image_url: string;
   badge?: string | null;
@@ -23,6 +25,7 @@ const Index = () => {
   const [products, setProducts] = useState<Product[]>([]);
   const [loading, setLoading] = useState(true);
   const { addToCart } = useCart();
+  const { token } = useAuth();
   const { toast } = useToast();
 
   const categories = [
@@ -41,7 +44,7 @@ const Index = () => {
           ? "https://functions.poehali.dev/12376e42-ed70-4d76-a79a-63a0d5b0e5c3"
           : `https://functions.poehali.dev/12376e42-ed70-4d76-a79a-63a0d5b0e5c3?category=${selectedCategory}`;
         
-        const response = await fetch(url);
+        const response = await fetch(url, token ? { headers: { 'X-Auth-Token': token } } : undefined);
         const data = await response.json();
         setProducts(data);
       } catch (error) {
@@ -57,7 +60,7 @@ const Index = () => {
     };
 
     fetchProducts();
-  }, [selectedCategory, toast]);
+  }, [selectedCategory, token, toast]);
 
   const handleAddToCart = (product: Product) => {
     addToCart({
@@ -230,7 +233,12 @@ const Index = () => {
                     <h3 className="font-semibold text-lg mb-2">{product.name}</h3>
                     <p className="text-sm text-muted-foreground mb-4 line-clamp-2">{product.description}</p>
                     <div className="flex items-center justify-between">
-                      <span className="text-2xl font-bold text-primary">{product.price} ₽</span>
+                      <div className="flex items-baseline gap-2">
+                        <span className="text-2xl font-bold text-primary">{product.price} ₽</span>
+                        {product.base_price !== undefined && product.base_price > product.price && (
+                          <span className="text-sm text-muted-foreground line-through">{product.base_price} ₽</span>
+                        )}
+                      </div>
                       <Button size="sm" className="gap-2" onClick={() => handleAddToCart(product)}>
                         <Icon name="ShoppingCart" size={16} />
                         В корзину